@@ -1,32 +1,62 @@
 import base64
 import datetime
 import functools
+import hashlib
 import json
+import math
 import os
 import pathlib
 import re
 import subprocess
 import unicodedata
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
+from types import SimpleNamespace
 from typing import Any, Dict, Iterable, List
 
-import parser
+import menu_builder
 import yaml
-from flask import Flask, jsonify, render_template, request, send_from_directory, abort
+from ingredient_index import BY_INGREDIENTS_LIMIT, IngredientBitsetIndex, IngredientNameIndex, ingredient_clusters
+from menu_history import cooked_dishes, load_history, popularity
+from menu_session import MenuSession
+from recipe_graph import RecipeCycleError, RecipeGraph
+from recipe_similarity import SIMILAR_LIMIT, MinHashIndex, TfidfIndex
+from recipe_search import (
+    FTS_MIN_QUERY,
+    TYPEAHEAD_LIMIT,
+    RecipeSearchIndex,
+    TypeaheadIndex,
+    fold_text,
+    init_recipe_fts,
+    search_recipe_fts,
+    sync_recipe_fts,
+)
+from result_cache import BackgroundResult, LRUCache
+from flask import Flask, Response, jsonify, render_template, request, send_from_directory, abort
 from flask_cors import CORS
-from fuzzywuzzy import fuzz
 from openai import OpenAI
-from sqlalchemy import or_
+from sqlalchemy import case, delete, func, or_, update
 from sqlmodel import select, Session
 from pydantic import BaseModel, Field
 
 from src.models import (
+    CONFIG_VERSION_KEY,
+    POPULARITY_VERSION_KEY,
+    RECIPES_VERSION_KEY,
+    STAPLES_VERSION_KEY,
     CategoryConfig,
     IngredientConfig,
+    MenuSessionState,
     Recipe,
+    RecipeIngredient,
+    RecipePopularity,
     StapleItem,
     AppSetting,
+    bump_version,
     get_session,
+    get_version,
+    get_versions,
     init_db,
 )
 
@@ -78,6 +108,8 @@ app.config.setdefault("FRONTEND_ORIGIN", os.getenv("FRONTEND_ORIGIN", "*"))
 CORS(app, resources={r"/api/*": {"origins": app.config["FRONTEND_ORIGIN"]}})
 
 init_db()
+with get_session() as _session:
+    _recipe_fts_enabled = init_recipe_fts(_session)
 _config_seeded = False
 _known_unit_cache: list[str] | None = None
 _unit_enum_cache: type[Enum] | None = None
@@ -139,13 +171,9 @@ def get_known_units() -> list[str]:
     if _known_unit_cache is not None:
         return _known_unit_cache
 
-    units: set[str] = set()
     with get_session() as session:
-        for recipe in session.exec(select(Recipe)).all():
-            for bucket in (recipe.ingredienser or {}).values():
-                units.add(_normalise_unit_value((bucket or {}).get("unit")))
-            for bucket in (recipe.extras or {}).values():
-                units.add(_normalise_unit_value((bucket or {}).get("unit")))
+        stored = session.exec(select(RecipeIngredient.unit).distinct()).all()
+    units: set[str] = {_normalise_unit_value(unit) for unit in stored}
 
     fallback_units = {"", "stk", "spsk", "tsk", "dl", "ml", "g", "kg", "l", "portion", "pk", "pose", "fed"}
     units.update(fallback_units)
@@ -309,6 +337,7 @@ def set_staple_label(label: str) -> str:
             session.add(record)
         else:
             session.add(AppSetting(key="staples_label", value=cleaned))
+        bump_version(session, STAPLES_VERSION_KEY)
         session.commit()
         return cleaned
 
@@ -368,6 +397,7 @@ def seed_staples_from_legacy() -> None:
             session.add(StapleItem(name=cleaned_name, amount=amount_value or 1.0, unit=unit_value))
             added = True
         if added:
+            bump_version(session, STAPLES_VERSION_KEY)
             session.commit()
 
     _staples_seeded = True
@@ -454,6 +484,35 @@ def serialise_recipe(recipe: Recipe) -> Dict[str, Any]:
     }
 
 
+_recipe_graph_cache: tuple[int, RecipeGraph] | None = None
+
+
+def get_recipe_graph() -> RecipeGraph:
+    global _recipe_graph_cache
+    with get_session() as session:
+        version = get_version(session, RECIPES_VERSION_KEY)
+    if _recipe_graph_cache is not None and _recipe_graph_cache[0] == version:
+        return _recipe_graph_cache[1]
+
+    graph = RecipeGraph(
+        serialise_recipe(recipe) for recipe in fetch_recipes(include_blacklisted=True)
+    )
+    _recipe_graph_cache = (version, graph)
+    return graph
+
+
+def _update_recipe_graph(version: int, base: RecipeGraph, graph: RecipeGraph) -> None:
+    """Keep ``graph`` (``base.with_recipe(...)`` for a committed write) for ``version``.
+
+    Only when ``base`` is the cached graph exactly one write behind; otherwise
+    another write got in between and the graph rebuilds on its next read.
+    """
+    global _recipe_graph_cache
+    if _recipe_graph_cache is None or _recipe_graph_cache != (version - 1, base):
+        return
+    _recipe_graph_cache = (version, graph)
+
+
 def serialise_category(category: CategoryConfig) -> Dict[str, Any]:
     return {
         "id": category.id,
@@ -634,12 +693,70 @@ def build_recipe_from_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
+def _recipe_ingredient_rows(recipe: Recipe) -> list[RecipeIngredient]:
+    rows = []
+    for field in ("ingredienser", "extras"):
+        for name, bucket in (getattr(recipe, field) or {}).items():
+            if not name:
+                continue
+            bucket = bucket or {}
+            try:
+                amount = float(bucket.get("amount"))
+            except (TypeError, ValueError):
+                amount = None
+            rows.append(RecipeIngredient(
+                recipe_id=recipe.id,
+                field=field,
+                name=name,
+                norm_name=fold_text(name),
+                amount=amount,
+                unit=bucket.get("unit"),
+            ))
+    return rows
+
+
+def _sync_recipe_indexes(session: Session, recipe: Recipe) -> None:
+    """Mirror ``recipe``'s JSON columns into ``RecipeIngredient`` (and FTS).
+
+    Call inside the write's transaction, after the recipe has an id.
+    """
+    session.execute(delete(RecipeIngredient).where(RecipeIngredient.recipe_id == recipe.id))
+    session.add_all(_recipe_ingredient_rows(recipe))
+    if _recipe_fts_enabled:
+        sync_recipe_fts(session, recipe)
+
+
+def backfill_recipe_ingredients() -> None:
+    """Mirror recipes that have no ``RecipeIngredient`` rows yet (older databases)."""
+    with get_session() as session:
+        missing = session.exec(
+            select(Recipe).where(Recipe.id.not_in(select(RecipeIngredient.recipe_id).distinct()))
+        ).all()
+        for recipe in missing:
+            session.add_all(_recipe_ingredient_rows(recipe))
+        if missing:
+            session.commit()
+
+
+backfill_recipe_ingredients()
+
+
 def create_recipe_record(recipe_payload: Dict[str, Any]) -> Recipe:
+    """Insert a recipe; raises ``RecipeCycleError`` if its extras would form a cycle."""
+    base_graph = get_recipe_graph()
+    graph = base_graph.with_recipe(recipe_payload)
     with get_session() as session:
         recipe = Recipe(**recipe_payload)
         session.add(recipe)
+        session.flush()
+        _sync_recipe_indexes(session, recipe)
+        version = bump_version(session, RECIPES_VERSION_KEY)
         session.commit()
         session.refresh(recipe)
+        _update_typeahead(version, added=recipe.navn if _recipe_visible(recipe) else None)
+        _update_ingredient_names(RECIPES_VERSION_KEY, version, added=_recipe_ingredient_names(recipe))
+        _update_duplicates(version, added=[recipe])
+        _update_recipe_graph(version, base_graph, graph)
         return recipe
 
 
@@ -726,10 +843,10 @@ def generate_recipe_from_image(
     return recipe_payload, raw_yaml
 
 
-def add_standard_items(menu_recipes: Dict[str, Any]) -> None:
+def staple_menu_entries() -> tuple[str, list[dict[str, dict[str, Any]]]]:
     staples = fetch_staples()
     if not staples:
-        return
+        return DEFAULT_STAPLE_LABEL, []
 
     label = get_staple_label()
     entries: list[dict[str, dict[str, Any]]] = []
@@ -744,7 +861,14 @@ def add_standard_items(menu_recipes: Dict[str, Any]) -> None:
                 }
             }
         )
+    return label, entries
 
+
+def add_standard_items(
+    menu_recipes: Dict[str, Any],
+    staples: tuple[str, list[dict[str, dict[str, Any]]]] | None = None,
+) -> None:
+    label, entries = staples if staples is not None else staple_menu_entries()
     if entries:
         menu_recipes[label] = entries
 
@@ -793,30 +917,97 @@ def favicon_svg():
     abort(404)
 
 
-@app.route('/search_recipes', methods=['GET'])
-def search_recipes():
-    try:
-        query = (request.args.get('query') or '').lower().strip()
-        recipes = fetch_recipes()
+_search_index_cache: tuple[tuple[int, int], RecipeSearchIndex] | None = None
+# (recipes and popularity versions, engine, normalised query) -> (names,
+# total_matches); a write moves a version so stale entries are never hit again.
+_search_cache = LRUCache(maxsize=int(os.getenv("SEARCH_CACHE_SIZE", "256")))
 
-        if not query:
-            return jsonify({'recipes': [recipe.navn for recipe in recipes[:6]]})
 
-        scored_matches: List[Dict[str, Any]] = []
+def _search_versions(session: Session) -> tuple[int, int]:
+    return get_versions(session, RECIPES_VERSION_KEY, POPULARITY_VERSION_KEY)
+
+
+def get_search_index(versions: tuple[int, int] | None = None) -> RecipeSearchIndex:
+    global _search_index_cache
+    with get_session() as session:
+        if versions is None:
+            versions = _search_versions(session)
+        if _search_index_cache is not None and _search_index_cache[0] == versions:
+            return _search_index_cache[1]
+        popularity = {
+            row.recipe_id: row.score for row in session.exec(select(RecipePopularity)).all()
+        }
+
+    index = RecipeSearchIndex(
+        (recipe.navn, list((recipe.ingredienser or {}).keys()), popularity.get(recipe.id, 0.0))
+        for recipe in fetch_recipes()
+    )
+    _search_index_cache = (versions, index)
+    return index
+
+
+_typeahead_cache: tuple[int, TypeaheadIndex] | None = None
+
 
-        for recipe in recipes:
-            score = fuzz.partial_ratio(query, recipe.navn.lower())
-            for ingredient_name in recipe.ingredienser.keys():
-                ingredient_score = fuzz.partial_ratio(query, ingredient_name.lower())
-                score = max(score, ingredient_score)
+def _recipe_visible(recipe: Recipe) -> bool:
+    return not recipe.is_blacklisted or recipe.is_whitelisted
 
-            if score > 80:
-                scored_matches.append({'name': recipe.navn, 'score': score})
 
-        sorted_matches = sorted(scored_matches, key=lambda x: -x['score'])
-        matched_names = [match['name'] for match in sorted_matches[:6]]
+def get_typeahead_index() -> TypeaheadIndex:
+    global _typeahead_cache
+    with get_session() as session:
+        version = get_version(session, RECIPES_VERSION_KEY)
+    if _typeahead_cache is not None and _typeahead_cache[0] == version:
+        return _typeahead_cache[1]
+
+    index = TypeaheadIndex(recipe.navn for recipe in fetch_recipes())
+    _typeahead_cache = (version, index)
+    return index
+
 
-        return jsonify({'recipes': matched_names, 'total_matches': len(scored_matches)})
+def _update_typeahead(version: int, removed: str | None = None, added: str | None = None) -> None:
+    """Apply one committed recipe write to the typeahead index in place.
+
+    ``version`` is the recipes version read inside the write's transaction. If
+    the index is not exactly one write behind it, another process wrote in
+    between and the index is left to rebuild on its next read.
+    """
+    global _typeahead_cache
+    if _typeahead_cache is None or _typeahead_cache[0] != version - 1:
+        return
+    index = _typeahead_cache[1]
+    if removed:
+        index.discard(removed)
+    if added:
+        index.add(added)
+    _typeahead_cache = (version, index)
+
+
+@app.route('/search_recipes', methods=['GET'])
+def search_recipes():
+    try:
+        query = (request.args.get('query') or '').lower().strip()
+        search_engine = (request.args.get('engine') or 'fuzzy').strip().lower()
+        if search_engine not in {'fuzzy', 'fts'}:
+            return jsonify({'error': "'engine' must be fuzzy or fts", 'recipes': []}), 400
+        if not (_recipe_fts_enabled and len(query) >= FTS_MIN_QUERY):
+            search_engine = 'fuzzy'
+
+        with get_session() as session:
+            versions = _search_versions(session)
+            cache_key = (versions, search_engine, query)
+            cached = _search_cache.get(cache_key)
+            if cached is None:
+                if search_engine == 'fts':
+                    cached = search_recipe_fts(session, query)
+                else:
+                    cached = get_search_index(versions).search(query)
+                _search_cache.put(cache_key, cached)
+        matched_names, total_matches = cached
+
+        if not query:
+            return jsonify({'recipes': matched_names})
+        return jsonify({'recipes': matched_names, 'total_matches': total_matches})
 
     except Exception as exc:
         app.logger.error("Error in search_recipes: %s", exc)
@@ -831,15 +1022,117 @@ app.add_url_rule(
 )
 
 
-def _norm_text(s: str) -> str:
-    s = s or ""
-    return (
-        unicodedata.normalize("NFKD", s)
-        .encode("ascii", "ignore")
-        .decode("ascii")
-        .lower()
-        .strip()
+def menu_history_dir() -> pathlib.Path:
+    return pathlib.Path(os.getenv("MENU_HISTORY_DIR", "menus"))
+
+
+def refresh_popularity() -> tuple[int, int]:
+    """Rescore ``RecipePopularity`` from the menu history; returns (menus, recipes)."""
+    history = load_history(menu_history_dir())
+    # exports file the staples under the configured label; older ones under another option
+    staple_sections = {*STAPLE_LABEL_OPTIONS, get_staple_label()}
+    staples = {item.name for item in fetch_staples()}
+    identifiers = {
+        identifier
+        for _, menu in history
+        for identifier in cooked_dishes(menu, staple_sections, staples)
+    }
+
+    with get_session() as session:
+        recipe_ids: Dict[str, int] = {}
+        if identifiers:
+            recipes = session.exec(
+                select(Recipe).where(or_(Recipe.slug.in_(identifiers), Recipe.navn.in_(identifiers)))
+            ).all()
+            for recipe in recipes:
+                recipe_ids[recipe.navn] = recipe.id
+            # slugs win over names, like menu_builder.prefetch_recipes
+            recipe_ids.update((recipe.slug, recipe.id) for recipe in recipes)
+        scores = popularity(
+            history, resolve=recipe_ids.get, staple_sections=staple_sections, staples=staples
+        )
+
+        for row in session.exec(select(RecipePopularity)).all():
+            session.delete(row)
+        for recipe_id, entry in scores.items():
+            session.add(RecipePopularity(recipe_id=recipe_id, **entry))
+        bump_version(session, POPULARITY_VERSION_KEY)
+        session.commit()
+
+    return len(history), len(scores)
+
+
+def seed_recipe_popularity() -> None:
+    """Score recipes once on a database that has recipes but no popularity rows yet."""
+    with get_session() as session:
+        if session.exec(select(RecipePopularity.recipe_id).limit(1)).first() is not None:
+            return
+        if session.exec(select(Recipe.id).limit(1)).first() is None:
+            return
+    refresh_popularity()
+
+
+seed_recipe_popularity()
+
+
+@app.route('/api/recipes/popularity/refresh', methods=['POST'])
+def refresh_recipe_popularity():
+    menus, recipes = refresh_popularity()
+    return jsonify({"menus": menus, "recipes": recipes})
+
+
+@app.route('/api/recipes/typeahead', methods=['GET'])
+def recipe_typeahead():
+    prefix = request.args.get('prefix') or ''
+    try:
+        limit = int(request.args.get('limit', TYPEAHEAD_LIMIT))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'limit' must be an integer"}), 400
+    limit = min(max(limit, 1), 50)
+    return jsonify({"recipes": get_typeahead_index().complete(prefix, limit)})
+
+
+_ingredient_index_cache: tuple[int, IngredientBitsetIndex] | None = None
+
+
+def get_ingredient_index() -> IngredientBitsetIndex:
+    global _ingredient_index_cache
+    with get_session() as session:
+        version = get_version(session, RECIPES_VERSION_KEY)
+    if _ingredient_index_cache is not None and _ingredient_index_cache[0] == version:
+        return _ingredient_index_cache[1]
+
+    index = IngredientBitsetIndex(
+        (recipe.navn, recipe.slug, list((recipe.ingredienser or {}).keys()))
+        for recipe in fetch_recipes()
     )
+    _ingredient_index_cache = (version, index)
+    return index
+
+
+@app.route('/api/recipes/by-ingredients', methods=['POST'])
+def recipes_by_ingredients():
+    try:
+        payload = request.get_json(force=True) or {}
+    except Exception:
+        payload = {}
+
+    ingredients = payload.get('ingredients')
+    if not isinstance(ingredients, list) or not all(isinstance(name, str) for name in ingredients):
+        return jsonify({"error": "'ingredients' must be a list of names"}), 400
+    try:
+        limit = min(max(int(payload.get('limit', BY_INGREDIENTS_LIMIT)), 1), 100)
+        max_missing = payload.get('max_missing')
+        max_missing = None if max_missing is None else max(int(max_missing), 0)
+    except (TypeError, ValueError):
+        return jsonify({"error": "'limit' and 'max_missing' must be integers"}), 400
+
+    matches, unknown = get_ingredient_index().match(ingredients, limit=limit, max_missing=max_missing)
+    return jsonify({"recipes": matches, "unknown": unknown})
+
+
+def _norm_text(s: str) -> str:
+    return fold_text(s)
 
 
 def _find_key(mapping: dict[str, Any], name: str, *, case_insensitive: bool = True) -> str | None:
@@ -854,22 +1147,46 @@ def _find_key(mapping: dict[str, Any], name: str, *, case_insensitive: bool = Tr
     return None
 
 
-def _collect_all_ingredient_names() -> list[str]:
-    names: set[str] = set()
+def _recipe_ingredient_names(recipe: Recipe) -> list[str]:
+    return [key for key in [*(recipe.ingredienser or {}), *(recipe.extras or {})] if key]
+
+
+_NAME_INDEX_KEYS = (RECIPES_VERSION_KEY, CONFIG_VERSION_KEY)
+_name_index_cache: tuple[tuple[int, int], IngredientNameIndex] | None = None
+
+
+def get_ingredient_name_index() -> IngredientNameIndex:
+    global _name_index_cache
+    with get_session() as session:
+        versions = get_versions(session, *_NAME_INDEX_KEYS)
+    if _name_index_cache is not None and _name_index_cache[0] == versions:
+        return _name_index_cache[1]
+
+    # reference counts: one per config item and per recipe key occurrence
     with get_session() as session:
-        # From config items
-        for item in session.exec(select(IngredientConfig)).all():
-            if item.name:
-                names.add(item.name)
-        # From recipes
-        for recipe in session.exec(select(Recipe)).all():
-            for key in (recipe.ingredienser or {}).keys():
-                if key:
-                    names.add(key)
-            for key in (recipe.extras or {}).keys():
-                if key:
-                    names.add(key)
-    return sorted(names)
+        names = list(session.exec(select(IngredientConfig.name)).all())
+        names.extend(session.exec(select(RecipeIngredient.name)).all())
+    index = IngredientNameIndex(names)
+    _name_index_cache = (versions, index)
+    return index
+
+
+def _update_ingredient_names(key: str, version: int, removed: Iterable[str] = (), added: Iterable[str] = ()) -> None:
+    """Apply one committed recipe/config write to the ingredient name index.
+
+    Same contract as ``_update_typeahead``: ``version`` is the new value of
+    ``key`` and the index is only patched when it was exactly one write behind.
+    """
+    global _name_index_cache
+    if _name_index_cache is None:
+        return
+    versions, index = _name_index_cache
+    position = _NAME_INDEX_KEYS.index(key)
+    if versions[position] != version - 1:
+        return
+    index.update(removed=removed, added=added)
+    versions = versions[:position] + (version,) + versions[position + 1:]
+    _name_index_cache = (versions, index)
 
 
 @app.route('/api/ingredients/similar')
@@ -883,20 +1200,67 @@ def similar_ingredients():
         limit = 10
 
     try:
-        pool = _collect_all_ingredient_names()
-        scored = [
-            (candidate, fuzz.ratio(name.lower(), (candidate or '').lower()))
-            for candidate in pool
-            if candidate and candidate.lower() != name.lower()
-        ]
-        scored.sort(key=lambda t: t[1], reverse=True)
-        names = [n for n, score in scored[:limit] if score >= 70]
-        return jsonify({"names": names})
+        return jsonify({"names": get_ingredient_name_index().similar(name, limit)})
     except Exception as exc:
         app.logger.exception("similar_ingredients failed: %s", exc)
         return jsonify({"error": "Failed to compute similar names"}), 500
 
 
+def _compute_ingredient_clusters(versions: tuple[int, int]) -> list[dict[str, Any]]:
+    # usage = RecipeIngredient rows per name; config-only names count 0
+    with get_session() as session:
+        usage = dict(session.exec(
+            select(RecipeIngredient.name, func.count()).group_by(RecipeIngredient.name)
+        ).all())
+        for name in session.exec(select(IngredientConfig.name)).all():
+            usage.setdefault(name, 0)
+    return ingredient_clusters({name: count for name, count in usage.items() if name})
+
+
+_ingredient_clusters = BackgroundResult(_compute_ingredient_clusters)
+
+
+@app.route('/api/ingredients/clusters')
+def ingredient_name_clusters():
+    with get_session() as session:
+        versions = get_versions(session, *_NAME_INDEX_KEYS)
+    try:
+        ready, clusters = _ingredient_clusters.get(versions, wait=_flag_enabled(request.args.get('wait')))
+    except Exception as exc:
+        app.logger.exception("ingredient_name_clusters failed: %s", exc)
+        return jsonify({"error": "Failed to cluster ingredient names"}), 500
+    if not ready:
+        return jsonify({"status": "computing"}), 202
+    return jsonify({"status": "ready", "clusters": clusters})
+
+
+def _ingredient_usages(names: Iterable[str], include_extras: bool = True) -> Dict[str, list[dict[str, Any]]]:
+    """Usages per requested name, answered with one indexed ``IN`` query.
+
+    Names are matched on their folded form, so ``"RODKAL"`` finds ``Rødkål``.
+    """
+    by_norm: Dict[str, list[str]] = {}
+    for name in names:
+        by_norm.setdefault(_norm_text(name), []).append(name)
+    fields = ["ingredienser", "extras"] if include_extras else ["ingredienser"]
+
+    with get_session() as session:
+        rows = session.exec(
+            select(RecipeIngredient.norm_name, Recipe.slug, Recipe.navn, RecipeIngredient.field)
+            .join(Recipe, Recipe.id == RecipeIngredient.recipe_id)
+            .where(RecipeIngredient.norm_name.in_(list(by_norm)), RecipeIngredient.field.in_(fields))
+            .distinct()
+            .order_by(Recipe.id, case((RecipeIngredient.field == "ingredienser", 0), else_=1))
+        ).all()
+
+    usages: Dict[str, list[dict[str, Any]]] = {name: [] for names in by_norm.values() for name in names}
+    for norm_name, slug, navn, field in rows:
+        usage = {"recipe_slug": slug, "recipe_name": navn, "field": field}
+        for name in by_norm[norm_name]:
+            usages[name].append(usage)
+    return usages
+
+
 @app.route('/api/ingredients/usage')
 def ingredient_usage():
     name = (request.args.get('name') or '').strip()
@@ -904,138 +1268,511 @@ def ingredient_usage():
     if not name:
         return jsonify({"error": "name is required"}), 400
 
-    usages: list[dict[str, Any]] = []
     try:
-        with get_session() as session:
-            for recipe in session.exec(select(Recipe)).all():
-                key = _find_key(recipe.ingredienser or {}, name, case_insensitive=True)
-                if key is not None:
-                    usages.append({
-                        "recipe_slug": recipe.slug,
-                        "recipe_name": recipe.navn,
-                        "field": "ingredienser",
-                    })
-                if include_extras:
-                    key2 = _find_key(recipe.extras or {}, name, case_insensitive=True)
-                    if key2 is not None:
-                        usages.append({
-                            "recipe_slug": recipe.slug,
-                            "recipe_name": recipe.navn,
-                            "field": "extras",
-                        })
-        return jsonify({"usages": usages})
+        return jsonify({"usages": _ingredient_usages([name], include_extras)[name]})
     except Exception as exc:
         app.logger.exception("ingredient_usage failed: %s", exc)
         return jsonify({"error": "Failed to search usage"}), 500
 
 
-@app.route('/api/ingredients/rename', methods=['POST'])
-def ingredient_rename():
+@app.route('/api/ingredients/usage/batch', methods=['POST'])
+def ingredient_usage_batch():
     try:
         payload = request.get_json(force=True) or {}
     except Exception:
         payload = {}
 
-    from_name = (payload.get('from') or '').strip()
-    to_name = (payload.get('to') or '').strip()
-    include_extras = bool(payload.get('include_extras', True))
-    force = bool(payload.get('force', False))
-    case_insensitive = bool(payload.get('case_insensitive', True))
+    names = payload.get('names')
+    if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        return jsonify({"error": "'names' must be a list of strings"}), 400
+    names = [name.strip() for name in names if name.strip()]
+    if not names:
+        return jsonify({"usages": {}})
 
-    if not from_name or not to_name:
-        return jsonify({"error": "'from' and 'to' are required"}), 400
+    try:
+        return jsonify({"usages": _ingredient_usages(names, _flag_enabled(payload.get('include_extras', True)))})
+    except Exception as exc:
+        app.logger.exception("ingredient_usage_batch failed: %s", exc)
+        return jsonify({"error": "Failed to search usage"}), 500
 
-    updated_count = 0
-    conflicts: list[dict[str, Any]] = []
 
-    def process_mapping(mapping: dict[str, Any]) -> tuple[dict[str, Any], bool, dict | None]:
-        if not mapping:
-            return mapping or {}, False, None
-        src_key = _find_key(mapping, from_name, case_insensitive=case_insensitive)
-        if not src_key:
-            return mapping, False, None
+def _rename_in_mapping(
+    mapping: dict[str, Any],
+    from_name: str,
+    to_name: str,
+    *,
+    case_insensitive: bool = True,
+    force: bool = False,
+) -> tuple[dict[str, Any], bool, dict | None]:
+    """Rename ``from_name`` in one ingredient mapping: ``(mapping, changed, conflict)``.
+
+    An existing destination with the same unit absorbs the source amount;
+    otherwise it is a conflict, resolved with ``force`` by dropping the source.
+    A rename that only changes case or diacritics re-keys the entry to
+    ``to_name``. ``changed`` is true only when the mapping differs;
+    ``mapping`` itself is never modified.
+    """
+    if not mapping:
+        return mapping or {}, False, None
+    if from_name in mapping:
+        src_key = from_name
+    elif case_insensitive:
+        # an entry already spelled ``to_name`` is the destination, not a source
+        target = _norm_text(from_name)
+        src_key = next((key for key in mapping if key != to_name and _norm_text(key) == target), None)
+    else:
+        src_key = None
+    if not src_key:
+        return mapping, False, None
+    if to_name in mapping:
+        dst_key = to_name
+    else:
         dst_key = _find_key(mapping, to_name, case_insensitive=case_insensitive) or to_name
-        if dst_key in mapping and dst_key != src_key:
-            src_val = mapping.get(src_key) or {}
-            dst_val = mapping.get(dst_key) or {}
-            try:
-                src_amt = float(src_val.get('amount', 0))
-            except Exception:
-                src_amt = None
-            try:
-                dst_amt = float(dst_val.get('amount', 0))
-            except Exception:
-                dst_amt = None
-            src_unit = (src_val.get('unit') or '').strip()
-            dst_unit = (dst_val.get('unit') or '').strip()
-            if src_amt is not None and dst_amt is not None and src_unit == dst_unit:
-                dst_val['amount'] = float(dst_amt) + float(src_amt)
+        if dst_key == src_key:
+            dst_key = to_name
+    if dst_key in mapping and dst_key != src_key:
+        src_val = mapping.get(src_key) or {}
+        dst_val = dict(mapping.get(dst_key) or {})
+        try:
+            src_amt = float(src_val.get('amount', 0))
+        except Exception:
+            src_amt = None
+        try:
+            dst_amt = float(dst_val.get('amount', 0))
+        except Exception:
+            dst_amt = None
+        src_unit = (src_val.get('unit') or '').strip()
+        dst_unit = (dst_val.get('unit') or '').strip()
+        if src_amt is not None and dst_amt is not None and src_unit == dst_unit:
+            dst_val['amount'] = float(dst_amt) + float(src_amt)
+            mapping = dict(mapping)
+            mapping[dst_key] = dst_val
+            mapping.pop(src_key, None)
+            return mapping, True, None
+        else:
+            if force:
+                # Remove the source to avoid duplication, keep destination as-is
                 mapping = dict(mapping)
-                mapping[dst_key] = dst_val
                 mapping.pop(src_key, None)
-                return mapping, True, None
+                return mapping, True, {"reason": "conflict (unit/amount mismatch) - removed source, kept destination"}
             else:
-                if force:
-                    # Remove the source to avoid duplication, keep destination as-is
-                    mapping = dict(mapping)
-                    mapping.pop(src_key, None)
-                    return mapping, True, {"reason": "conflict (unit/amount mismatch) - removed source, kept destination"}
-                else:
-                    return mapping, False, {"reason": "conflict (unit/amount mismatch)", "conflict_with": dst_key}
-        else:
-            mapping = dict(mapping)
-            mapping[dst_key] = mapping.get(src_key) or {}
-            if dst_key != src_key:
-                mapping.pop(src_key, None)
-            return mapping, True, None
+                return mapping, False, {"reason": "conflict (unit/amount mismatch)", "conflict_with": dst_key}
+    else:
+        if dst_key == src_key:
+            return mapping, False, None
+        renamed = dict(mapping)
+        renamed[dst_key] = renamed.pop(src_key) or {}
+        return renamed, True, None
 
-    try:
-        with get_session() as session:
-            recipes = session.exec(select(Recipe)).all()
-            for recipe in recipes:
-                changed = False
-                # ingredienser
-                new_map, mutated, conflict = process_mapping(recipe.ingredienser or {})
-                if mutated:
-                    recipe.ingredienser = new_map
-                    changed = True
+
+def _mapping_diff(before: dict[str, Any], after: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
+    keys = [key for key in {**before, **after} if key not in before or key not in after or before[key] != after[key]]
+    return (
+        {key: before[key] for key in keys if key in before},
+        {key: after[key] for key in keys if key in after},
+    )
+
+
+def _plan_ingredient_renames(
+    session: Session,
+    pairs: list[tuple[str, str]],
+    *,
+    include_extras: bool = True,
+    case_insensitive: bool = True,
+    force: bool = False,
+) -> tuple[list[tuple[SimpleNamespace, SimpleNamespace]], list[dict[str, Any]], list[dict[str, Any]], list[int]]:
+    """Work out ordered ``(from, to)`` renames without writing.
+
+    Returns ``(renamed, changes, conflicts, counts)``. Only recipes whose
+    ``RecipeIngredient`` rows hold a source name are read, as plain column
+    rows, and each gets every pair applied in order. ``renamed`` pairs each
+    changed recipe's current and renamed state; ``changes`` is the per-field
+    diff of the keys that change; ``counts[i]`` is how many recipes pair ``i``
+    changed.
+    """
+    if case_insensitive:
+        source = RecipeIngredient.norm_name.in_({_norm_text(from_name) for from_name, _ in pairs})
+    else:
+        source = RecipeIngredient.name.in_({from_name for from_name, _ in pairs})
+    fields = ["ingredienser", "extras"] if include_extras else ["ingredienser"]
+    rows = session.exec(
+        select(Recipe.id, Recipe.slug, Recipe.navn, Recipe.placering, Recipe.ingredienser, Recipe.extras)
+        .where(Recipe.id.in_(
+            select(RecipeIngredient.recipe_id).where(source, RecipeIngredient.field.in_(fields))
+        ))
+        .order_by(Recipe.id)
+    ).all()
+
+    renamed = []
+    changes: list[dict[str, Any]] = []
+    conflicts: list[dict[str, Any]] = []
+    counts = [0] * len(pairs)
+    for row in rows:
+        before = SimpleNamespace(**row._mapping)
+        after = SimpleNamespace(**row._mapping)
+        touched: set[int] = set()
+        for field in fields:
+            mapping = getattr(before, field) or {}
+            new_map = mapping
+            for position, (from_name, to_name) in enumerate(pairs):
+                new_map, mutated, conflict = _rename_in_mapping(
+                    new_map, from_name, to_name, case_insensitive=case_insensitive, force=force
+                )
                 if conflict:
                     conflicts.append({
-                        "slug": recipe.slug,
-                        "name": recipe.navn,
-                        "field": "ingredienser",
+                        "slug": before.slug,
+                        "name": before.navn,
+                        "field": field,
+                        "from": from_name,
+                        "to": to_name,
                         **conflict,
                     })
-                # extras
-                if include_extras:
-                    new_extra_map, mutated2, conflict2 = process_mapping(recipe.extras or {})
-                    if mutated2:
-                        recipe.extras = new_extra_map
-                        changed = True
-                    if conflict2:
+                if mutated:
+                    touched.add(position)
+            if new_map == mapping:
+                continue
+            setattr(after, field, new_map)
+            removed, added = _mapping_diff(mapping, new_map)
+            changes.append({
+                "slug": before.slug,
+                "name": before.navn,
+                "field": field,
+                "before": removed,
+                "after": added,
+            })
+        for position in touched:
+            counts[position] += 1
+        if after != before:
+            renamed.append((before, after))
+    return renamed, changes, conflicts, counts
+
+
+def _resolve_rename_chains(pairs: list[tuple[str, str]], *, case_insensitive: bool = True) -> list[tuple[str, str]]:
+    """Point every source at its final name: ``a→b, b→c`` becomes ``a→c, b→c``.
+
+    Raises ``ValueError`` when a name is renamed twice or the plan loops.
+    """
+    key = _norm_text if case_insensitive else (lambda name: name)
+    targets: dict[str, str] = {}
+    for from_name, to_name in pairs:
+        if key(from_name) in targets:
+            raise ValueError(f"'{from_name}' is renamed more than once")
+        targets[key(from_name)] = to_name
+
+    resolved = []
+    for from_name, to_name in pairs:
+        current, seen = to_name, {key(from_name)}
+        while key(current) in targets:
+            following = targets[key(current)]
+            if key(following) == key(current):
+                # a spelling fix of the same name ends the chain
+                current = following
+                break
+            if key(following) in seen:
+                raise ValueError(f"Rename plan loops back to '{following}'")
+            seen.add(key(current))
+            current = following
+        resolved.append((from_name, current))
+    return resolved
+
+
+def _rename_named_rows(
+    session: Session,
+    rows: list[Any],
+    pairs: list[tuple[str, str]],
+    *,
+    field: str,
+    merge,
+    case_insensitive: bool = True,
+    force: bool = False,
+) -> tuple[list[int], list[dict[str, Any]], list[str], list[str]]:
+    """Rename ``IngredientConfig``/``StapleItem`` rows for each pair, inside the session.
+
+    A source whose destination already exists is deleted once
+    ``merge(source, destination)`` folds it in, or with ``force``; otherwise
+    it is reported as a conflict. Returns ``(counts, conflicts, removed, added)``
+    with the names that left and joined the table.
+    """
+    key = _norm_text if case_insensitive else (lambda name: name)
+    live = list(rows)
+    counts = [0] * len(pairs)
+    conflicts: list[dict[str, Any]] = []
+    removed: list[str] = []
+    added: list[str] = []
+    for position, (from_name, to_name) in enumerate(pairs):
+        sources = [row for row in live if key(row.name) == key(from_name)]
+        destination = next((row for row in live if row.name == to_name), None) or next(
+            (row for row in live if key(row.name) == key(to_name)), None
+        )
+        for row in sources:
+            if row is destination and row.name == to_name:
+                continue
+            if destination is None or row is destination:
+                removed.append(row.name)
+                row.name = to_name
+                added.append(to_name)
+                session.add(row)
+                destination = row
+            else:
+                conflict = {"field": field, "name": row.name, "from": from_name, "to": to_name}
+                if not merge(row, destination):
+                    if not force:
                         conflicts.append({
-                            "slug": recipe.slug,
-                            "name": recipe.navn,
-                            "field": "extras",
-                            **conflict2,
+                            **conflict,
+                            "reason": "conflict (unit/category mismatch)",
+                            "conflict_with": destination.name,
                         })
-                if changed:
-                    session.add(recipe)
-                    updated_count += 1
+                        continue
+                    conflicts.append({
+                        **conflict,
+                        "reason": "conflict (unit/category mismatch) - removed source, kept destination",
+                    })
+                removed.append(row.name)
+                live.remove(row)
+                session.delete(row)
+            # names are unique: flush each step so renames never collide with pending deletes
+            session.flush()
+            counts[position] += 1
+    return counts, conflicts, removed, added
+
+
+def _apply_recipe_updates(session: Session, renamed: list[tuple[SimpleNamespace, SimpleNamespace]]) -> None:
+    """Write the new ingredient mappings and re-mirror them, inside the caller's transaction."""
+    session.execute(
+        update(Recipe),
+        [{"id": after.id, "ingredienser": after.ingredienser, "extras": after.extras} for _, after in renamed],
+    )
+    session.execute(delete(RecipeIngredient).where(RecipeIngredient.recipe_id.in_([after.id for _, after in renamed])))
+    for _, after in renamed:
+        session.add_all(_recipe_ingredient_rows(after))
+        if _recipe_fts_enabled:
+            sync_recipe_fts(session, after)
+
+
+@app.route('/api/ingredients/rename', methods=['POST'])
+def ingredient_rename():
+    try:
+        payload = request.get_json(force=True) or {}
+    except Exception:
+        payload = {}
+
+    from_name = (payload.get('from') or '').strip()
+    to_name = (payload.get('to') or '').strip()
+    include_extras = bool(payload.get('include_extras', True))
+    force = bool(payload.get('force', False))
+    case_insensitive = bool(payload.get('case_insensitive', True))
+    dry_run = _flag_enabled(payload.get('dry_run', False))
+
+    if not from_name or not to_name:
+        return jsonify({"error": "'from' and 'to' are required"}), 400
+
+    try:
+        with get_session() as session:
+            renamed, changes, conflicts, _ = _plan_ingredient_renames(
+                session,
+                [(from_name, to_name)],
+                include_extras=include_extras,
+                case_insensitive=case_insensitive,
+                force=force,
+            )
+            if dry_run:
+                return jsonify({
+                    "dry_run": True,
+                    "updated_count": len(renamed),
+                    "changes": changes,
+                    "conflicts": conflicts,
+                })
+            if renamed:
+                _apply_recipe_updates(session, renamed)
+                version = bump_version(session, RECIPES_VERSION_KEY)
             session.commit()
-        return jsonify({"updated_count": updated_count, "conflicts": conflicts})
+        if renamed:
+            # recipe names are unchanged; only move the index to the new version
+            _update_typeahead(version)
+            _update_ingredient_names(
+                RECIPES_VERSION_KEY,
+                version,
+                removed=[name for before, _ in renamed for name in _recipe_ingredient_names(before)],
+                added=[name for _, after in renamed for name in _recipe_ingredient_names(after)],
+            )
+            _update_duplicates(
+                version, removed=[before.navn for before, _ in renamed], added=[after for _, after in renamed]
+            )
+        return jsonify({"updated_count": len(renamed), "conflicts": conflicts})
     except Exception as exc:
         app.logger.exception("ingredient_rename failed: %s", exc)
         return jsonify({"error": "Failed to rename ingredient"}), 500
 
 
-@app.route('/generate_menu', methods=['POST'])
-def generate_menu():
-    chosen_recipes = request.json.get('menu_data', {})
-    recipe_objects = fetch_recipes_by_names(chosen_recipes.keys())
+def _merge_staple(source: StapleItem, destination: StapleItem) -> bool:
+    if (source.unit or '').strip() != (destination.unit or '').strip():
+        return False
+    destination.amount = float(destination.amount or 0) + float(source.amount or 0)
+    return True
+
+
+@app.route('/api/ingredients/rename/batch', methods=['POST'])
+def ingredient_rename_batch():
+    try:
+        payload = request.get_json(force=True) or {}
+    except Exception:
+        payload = {}
+
+    include_extras = bool(payload.get('include_extras', True))
+    force = bool(payload.get('force', False))
+    case_insensitive = bool(payload.get('case_insensitive', True))
+    dry_run = _flag_enabled(payload.get('dry_run', False))
+
+    plan = payload.get('renames')
+    if not isinstance(plan, list) or not plan:
+        return jsonify({"error": "'renames' must be a non-empty list"}), 400
+    pairs = []
+    for entry in plan:
+        if not isinstance(entry, dict):
+            return jsonify({"error": "Each rename needs 'from' and 'to'"}), 400
+        from_name = (entry.get('from') or '').strip()
+        to_name = (entry.get('to') or '').strip()
+        if not from_name or not to_name:
+            return jsonify({"error": "Each rename needs 'from' and 'to'"}), 400
+        pairs.append((from_name, to_name))
+    try:
+        pairs = _resolve_rename_chains(pairs, case_insensitive=case_insensitive)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    options = {"case_insensitive": case_insensitive, "force": force}
+    try:
+        with get_session() as session:
+            renamed, changes, conflicts, counts = _plan_ingredient_renames(
+                session, pairs, include_extras=include_extras, **options
+            )
+            config_counts, config_conflicts, config_removed, config_added = _rename_named_rows(
+                session,
+                session.exec(select(IngredientConfig).order_by(IngredientConfig.id)).all(),
+                pairs,
+                field="config",
+                merge=lambda source, destination: source.category_id == destination.category_id,
+                **options,
+            )
+            staple_counts, staple_conflicts, _, _ = _rename_named_rows(
+                session,
+                session.exec(select(StapleItem).order_by(StapleItem.id)).all(),
+                pairs,
+                field="staples",
+                merge=_merge_staple,
+                **options,
+            )
+            conflicts.extend(config_conflicts + staple_conflicts)
+            results = [
+                {
+                    "from": from_name,
+                    "to": to_name,
+                    "updated_count": counts[position],
+                    "config_updated": config_counts[position],
+                    "staples_updated": staple_counts[position],
+                }
+                for position, (from_name, to_name) in enumerate(pairs)
+            ]
+            if dry_run:
+                # the session closes without committing, so config/staple edits roll back
+                return jsonify({
+                    "dry_run": True,
+                    "renames": results,
+                    "updated_count": len(renamed),
+                    "changes": changes,
+                    "conflicts": conflicts,
+                })
+            recipes_version = config_version = None
+            if renamed:
+                _apply_recipe_updates(session, renamed)
+                recipes_version = bump_version(session, RECIPES_VERSION_KEY)
+            if any(config_counts):
+                config_version = bump_version(session, CONFIG_VERSION_KEY)
+            if any(staple_counts):
+                bump_version(session, STAPLES_VERSION_KEY)
+            session.commit()
+        if recipes_version is not None:
+            _update_typeahead(recipes_version)
+            _update_ingredient_names(
+                RECIPES_VERSION_KEY,
+                recipes_version,
+                removed=[name for before, _ in renamed for name in _recipe_ingredient_names(before)],
+                added=[name for _, after in renamed for name in _recipe_ingredient_names(after)],
+            )
+            _update_duplicates(
+                recipes_version, removed=[before.navn for before, _ in renamed], added=[after for _, after in renamed]
+            )
+        if config_version is not None:
+            _update_ingredient_names(CONFIG_VERSION_KEY, config_version, removed=config_removed, added=config_added)
+        return jsonify({"renames": results, "updated_count": len(renamed), "conflicts": conflicts})
+    except Exception as exc:
+        app.logger.exception("ingredient_rename_batch failed: %s", exc)
+        return jsonify({"error": "Failed to rename ingredients"}), 500
+
+
+def _flag_enabled(value: Any) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in {'1', 'true', 'yes'}
+    return bool(value)
+
+
+MENU_FORMAT_MIMETYPES = {
+    "markdown": "text/markdown",
+    "csv": "text/csv",
+    "text": "text/plain",
+}
+
+
+def _requested_menu_format() -> str | None:
+    """Explicit ``format`` (query or body) first, then a text ``Accept`` header."""
+    requested = request.args.get('format') or (request.get_json(silent=True) or {}).get('format')
+    if requested:
+        return str(requested).strip().lower()
+    best = request.accept_mimetypes.best
+    for output_format, mimetype in MENU_FORMAT_MIMETYPES.items():
+        if best == mimetype:
+            return output_format
+    return None
 
-    if not recipe_objects:
-        return jsonify({"error": "No valid recipes supplied"}), 400
+
+def _menu_response(result: menu_builder.MenuResult, output_format: str | None):
+    if output_format == "json":
+        return jsonify(result.to_dict())
+    if output_format in MENU_FORMAT_MIMETYPES:
+        body = result.render(output_format)
+        return Response(body, mimetype=MENU_FORMAT_MIMETYPES[output_format])
+    return jsonify({"markdown": result.render("markdown"), **result.to_dict()})
+
+
+_menu_cache = LRUCache(maxsize=int(os.getenv("MENU_CACHE_SIZE", "128")))
+
+
+def _menu_cache_key(chosen_recipes: Dict[str, Any]) -> str:
+    """Hash the requested menu together with every version it depends on.
+
+    Any recipe, config or staples write bumps one of the versions, so stale
+    entries are simply never looked up again and age out of the LRU.
+    """
+    with get_session() as session:
+        versions = get_versions(session, RECIPES_VERSION_KEY, CONFIG_VERSION_KEY, STAPLES_VERSION_KEY)
+    normalised = [
+        [name, float(plates) if isinstance(plates, (int, float)) else plates]
+        for name, plates in chosen_recipes.items()
+    ]
+    encoded = json.dumps([normalised, versions], default=str, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def build_menu_structure(
+    chosen_recipes: Dict[str, Any],
+    recipe_objects: Dict[str, Recipe] | None = None,
+    staples: tuple[str, list[dict[str, dict[str, Any]]]] | None = None,
+) -> Dict[str, Any] | None:
+    if recipe_objects is None:
+        recipe_objects = fetch_recipes_by_names(chosen_recipes.keys())
+
+    if not any(name in recipe_objects for name in chosen_recipes):
+        return None
 
     menu_structure: Dict[str, Any] = {}
     for recipe_name, plates in chosen_recipes.items():
@@ -1051,13 +1788,34 @@ def generate_menu():
             }
         ]
 
-    add_standard_items(menu_structure)
-    menu_path = save_menu(menu_structure)
+    add_standard_items(menu_structure, staples)
+    return menu_structure
+
+
+@app.route('/generate_menu', methods=['POST'])
+def generate_menu():
+    chosen_recipes = request.json.get('menu_data', {})
+
+    output_format = _requested_menu_format()
+    if output_format is not None and output_format != "json" and output_format not in menu_builder.RENDERERS:
+        return jsonify({"error": f"Unsupported format '{output_format}'"}), 400
 
-    menu_text = MenuText()
-    parser.write_menu(menu_path, printer=menu_text.add)
+    cache_key = _menu_cache_key(chosen_recipes)
+    cached = _menu_cache.get(cache_key)
+    if cached is None:
+        menu_structure = build_menu_structure(chosen_recipes)
+        if menu_structure is None:
+            return jsonify({"error": "No valid recipes supplied"}), 400
+        cached = (menu_structure, menu_builder.expand_menu(menu_structure))
+        _menu_cache.put(cache_key, cached)
+    menu_structure, result = cached
 
-    return jsonify({"markdown": str(menu_text)})
+    if _flag_enabled(request.json.get('export')):
+        save_menu(menu_structure)
+        refresh_popularity()
+        MenuText(result.render("markdown")).write()
+
+    return _menu_response(result, output_format)
 
 
 app.add_url_rule(
@@ -1068,6 +1826,252 @@ app.add_url_rule(
 )
 
 
+MENU_BATCH_WORKERS = int(os.getenv("MENU_BATCH_WORKERS", "4"))
+
+
+@app.route('/api/menu/generate/batch', methods=['POST'])
+def generate_menu_batch():
+    try:
+        payload = request.get_json(force=True) or {}
+    except Exception:
+        payload = {}
+
+    menus = payload.get('menus')
+    if not isinstance(menus, list) or not menus:
+        return jsonify({"error": "'menus' must be a non-empty list"}), 400
+
+    weeks: list[tuple[str | None, Dict[str, Any]]] = []
+    for index, entry in enumerate(menus):
+        chosen = entry.get('menu_data') if isinstance(entry, dict) else None
+        if not isinstance(chosen, dict):
+            return jsonify({"error": f"menus[{index}].menu_data must be an object"}), 400
+        weeks.append((entry.get('name'), chosen))
+
+    output_format = _requested_menu_format()
+    if output_format not in (None, "json"):
+        return jsonify({"error": "Batch generation only returns JSON; use format=json or omit it"}), 400
+
+    # Resolve everything the weeks share once: recipes, staples, config.
+    recipe_objects = fetch_recipes_by_names(name for _, chosen in weeks for name in chosen)
+    staples = staple_menu_entries()
+    structures = []
+    for index, (_, chosen) in enumerate(weeks):
+        structure = build_menu_structure(chosen, recipe_objects, staples)
+        if structure is None:
+            return jsonify({"error": f"menus[{index}] has no valid recipes"}), 400
+        structures.append(structure)
+
+    config = menu_builder.load_config()
+    recipes = menu_builder.prefetch_recipes(
+        identifier for structure in structures for identifier in menu_builder.menu_identifiers(structure)
+    )
+
+    def expand(structure: Dict[str, Any]) -> menu_builder.MenuResult:
+        return menu_builder.expand_menu(structure, config=config, recipes=recipes)
+
+    workers = max(1, min(MENU_BATCH_WORKERS, len(structures)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(expand, structures))
+
+    def week_payload(result: menu_builder.MenuResult) -> Dict[str, Any]:
+        if output_format == "json":
+            return result.to_dict()
+        return {"markdown": result.render("markdown"), **result.to_dict()}
+
+    response: Dict[str, Any] = {
+        "weeks": [
+            {"name": name, **week_payload(result)}
+            for (name, _), result in zip(weeks, results)
+        ]
+    }
+    if _flag_enabled(payload.get('combined')):
+        response["combined"] = week_payload(menu_builder.merge_results(results))
+    return jsonify(response)
+
+
+# Sessions are stored as their plates (``MenuSessionState``) so any worker can
+# serve them; each worker keeps built sessions here as ``(revision, session)``
+# and rebuilds one when the stored revision moved on.
+_menu_sessions = LRUCache(maxsize=int(os.getenv("MENU_SESSION_LIMIT", "256")))
+MENU_SESSION_TTL_DAYS = float(os.getenv("MENU_SESSION_TTL_DAYS", "7"))
+
+
+def _menu_versions() -> tuple[int, ...]:
+    with get_session() as session:
+        return get_versions(session, RECIPES_VERSION_KEY, CONFIG_VERSION_KEY, STAPLES_VERSION_KEY)
+
+
+def _create_menu_session(plates_by_name: Dict[str, Any]) -> MenuSession:
+    recipe_objects = fetch_recipes_by_names(plates_by_name)
+    menu_session = MenuSession(menu_builder.load_config(), staple_menu_entries(), _menu_versions())
+    menu_session.recipes.update(
+        menu_builder.prefetch_recipes(recipe.slug for recipe in recipe_objects.values())
+    )
+    for name, plates in plates_by_name.items():
+        recipe = recipe_objects.get(name)
+        if recipe:
+            menu_session.set_dish(recipe.navn, recipe.slug, plates)
+    return menu_session
+
+
+def _load_menu_session(session_id: str) -> tuple[int, MenuSession] | None:
+    with get_session() as session:
+        state = session.get(MenuSessionState, session_id)
+        if state is None:
+            _menu_sessions.pop(session_id)
+            return None
+        revision, plates = state.revision, dict(state.plates or {})
+    cached = _menu_sessions.get(session_id)
+    if cached is not None and cached[0] == revision:
+        return cached
+    loaded = (revision, _create_menu_session(plates))
+    _menu_sessions.put(session_id, loaded)
+    return loaded
+
+
+def _save_menu_session(session_id: str, revision: int, menu_session: MenuSession) -> bool:
+    """Store the session's plates if nobody saved it since ``revision``."""
+    with get_session() as session:
+        saved = session.execute(
+            update(MenuSessionState)
+            .where(MenuSessionState.session_id == session_id, MenuSessionState.revision == revision)
+            .values(plates=menu_session.plates, revision=revision + 1, updated_at=datetime.datetime.now(datetime.timezone.utc))
+        ).rowcount
+        session.commit()
+    if not saved:
+        _menu_sessions.pop(session_id)
+        return False
+    _menu_sessions.put(session_id, (revision + 1, menu_session))
+    return True
+
+
+def _menu_session_payload(session_id: str, menu_session: MenuSession) -> Dict[str, Any]:
+    return {"session_id": session_id, "plates": menu_session.plates, **menu_session.result().to_dict()}
+
+
+def _parse_plates(value: Any) -> float:
+    try:
+        plates = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("'plates' must be a non-negative number") from None
+    if not math.isfinite(plates) or plates < 0:
+        raise ValueError("'plates' must be a non-negative number")
+    return plates
+
+
+@app.route('/api/menu/sessions', methods=['POST'])
+def create_menu_session():
+    try:
+        payload = request.get_json(force=True) or {}
+    except Exception:
+        payload = {}
+
+    chosen = payload.get('menu_data') or {}
+    if not isinstance(chosen, dict):
+        return jsonify({"error": "'menu_data' must be an object"}), 400
+    try:
+        plates_by_name = {name: _parse_plates(plates) for name, plates in chosen.items()}
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    menu_session = _create_menu_session(plates_by_name)
+    session_id = uuid.uuid4().hex
+    with get_session() as session:
+        expired = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=MENU_SESSION_TTL_DAYS)
+        session.execute(delete(MenuSessionState).where(MenuSessionState.updated_at < expired))
+        session.add(MenuSessionState(session_id=session_id, plates=menu_session.plates))
+        session.commit()
+    _menu_sessions.put(session_id, (1, menu_session))
+    return jsonify(_menu_session_payload(session_id, menu_session)), 201
+
+
+@app.route('/api/menu/sessions/<string:session_id>', methods=['GET'])
+def get_menu_session(session_id: str):
+    loaded = _load_menu_session(session_id)
+    if loaded is None:
+        return jsonify({"error": "Menu session not found"}), 404
+    return jsonify(_menu_session_payload(session_id, loaded[1]))
+
+
+@app.route('/api/menu/sessions/<string:session_id>', methods=['PATCH'])
+def update_menu_session(session_id: str):
+    loaded = _load_menu_session(session_id)
+    if loaded is None:
+        return jsonify({"error": "Menu session not found"}), 404
+    revision, menu_session = loaded
+
+    try:
+        payload = request.get_json(force=True) or {}
+    except Exception:
+        payload = {}
+    changes = payload.get('changes', [payload])
+    if not isinstance(changes, list) or not changes:
+        return jsonify({"error": "'changes' must be a non-empty list"}), 400
+
+    # Validate every change before applying any, so a bad one leaves the session untouched.
+    planned = []
+    on_menu = set(menu_session.plates)
+    for change in changes:
+        op = (change.get('op') or '').strip() if isinstance(change, dict) else ''
+        if op not in {'add', 'remove', 'set_plates'}:
+            return jsonify({"error": "Each change needs 'op' set to add, remove or set_plates"}), 400
+        recipe = fetch_recipe_by_identifier((change.get('recipe') or '').strip())
+        if recipe is None:
+            return jsonify({"error": "Recipe not found"}), 404
+        if op != 'add' and recipe.navn not in on_menu:
+            return jsonify({"error": f"'{recipe.navn}' is not on this menu"}), 400
+
+        if op == 'remove':
+            on_menu.discard(recipe.navn)
+            planned.append((recipe, None))
+            continue
+        try:
+            plates = _parse_plates(change.get('plates', recipe.antal))
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+        on_menu.add(recipe.navn)
+        planned.append((recipe, plates))
+
+    rebuilt = menu_session.versions != _menu_versions()
+    if rebuilt:
+        # A recipe, config or staples write happened since the session was built.
+        menu_session = _create_menu_session(menu_session.plates)
+
+    touched: set[tuple[int, str]] = set()
+    for recipe, plates in planned:
+        if plates is None:
+            touched |= menu_session.remove_dish(recipe.navn)
+        else:
+            touched |= menu_session.set_dish(recipe.navn, recipe.slug, plates)
+    if not _save_menu_session(session_id, revision, menu_session):
+        return jsonify({"error": "Menu session was changed by another request; reload it and retry"}), 409
+
+    return jsonify({
+        "session_id": session_id,
+        "plates": menu_session.plates,
+        "rebuilt": rebuilt,
+        "changed": menu_session.lines(set(menu_session.shopping) if rebuilt else touched),
+    })
+
+
+@app.route('/api/menu/sessions/<string:session_id>', methods=['DELETE'])
+def delete_menu_session(session_id: str):
+    _menu_sessions.pop(session_id)
+    with get_session() as session:
+        deleted = session.execute(
+            delete(MenuSessionState).where(MenuSessionState.session_id == session_id)
+        ).rowcount
+        session.commit()
+    if not deleted:
+        return jsonify({"error": "Menu session not found"}), 404
+    return jsonify({"message": "Menu session deleted"})
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({"menu": _menu_cache.stats(), "search": _search_cache.stats()})
+
+
 @app.route('/api/recipes', methods=['GET'])
 def list_recipes():
     include_blacklisted = request.args.get('include_blacklisted', 'true').lower() not in {'0', 'false', 'no'}
@@ -1091,6 +2095,113 @@ def get_recipe(identifier: str):
     return jsonify({"recipe": serialise_recipe(recipe)})
 
 
+@app.route('/api/recipes/<string:identifier>/bom', methods=['GET'])
+def recipe_bill_of_materials(identifier: str):
+    graph = get_recipe_graph()
+    navn = graph.resolve(identifier)
+    if navn is None:
+        return jsonify({"error": "Recipe not found"}), 404
+
+    plates_raw = request.args.get('plates')
+    try:
+        plates = float(plates_raw) if plates_raw is not None else float(graph.recipes[navn]["antal"])
+    except ValueError:
+        return jsonify({"error": "'plates' must be a non-negative number"}), 400
+    if not math.isfinite(plates) or plates < 0:
+        return jsonify({"error": "'plates' must be a non-negative number"}), 400
+
+    try:
+        multiplier, items = graph.bill_of_materials(navn, {"amount": plates, "unit": "plates"})
+    except RecipeCycleError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    return jsonify({
+        "recipe": navn,
+        "plates": plates,
+        "multiplier": multiplier,
+        "items": items,
+    })
+
+
+_similarity_cache: tuple[int, TfidfIndex] | None = None
+
+
+def get_similarity_index() -> TfidfIndex:
+    global _similarity_cache
+    with get_session() as session:
+        version = get_version(session, RECIPES_VERSION_KEY)
+    if _similarity_cache is not None and _similarity_cache[0] == version:
+        return _similarity_cache[1]
+
+    index = TfidfIndex(
+        (recipe.navn, recipe.slug, list((recipe.ingredienser or {}).keys()), _recipe_visible(recipe))
+        for recipe in fetch_recipes(include_blacklisted=True)
+    )
+    _similarity_cache = (version, index)
+    return index
+
+
+_duplicate_index_cache: tuple[int, MinHashIndex] | None = None
+
+
+def get_duplicate_index() -> MinHashIndex:
+    global _duplicate_index_cache
+    with get_session() as session:
+        version = get_version(session, RECIPES_VERSION_KEY)
+    if _duplicate_index_cache is not None and _duplicate_index_cache[0] == version:
+        return _duplicate_index_cache[1]
+
+    index = MinHashIndex(
+        (recipe.navn, recipe.slug, list((recipe.ingredienser or {}).keys()))
+        for recipe in fetch_recipes(include_blacklisted=True)
+    )
+    _duplicate_index_cache = (version, index)
+    return index
+
+
+def _update_duplicates(version: int, removed: Iterable[str] = (), added: Iterable[Recipe] = ()) -> None:
+    """Apply one committed recipe write to the duplicate index in place.
+
+    Same contract as ``_update_typeahead``; ``removed`` are recipe names and
+    ``added`` the recipes as written (anything with ``navn``, ``slug`` and
+    ``ingredienser``).
+    """
+    global _duplicate_index_cache
+    if _duplicate_index_cache is None or _duplicate_index_cache[0] != version - 1:
+        return
+    index = _duplicate_index_cache[1]
+    for navn in removed:
+        index.discard(navn)
+    for recipe in added:
+        index.add(recipe.navn, recipe.slug, list((recipe.ingredienser or {}).keys()))
+    _duplicate_index_cache = (version, index)
+
+
+@app.route('/api/recipes/duplicates', methods=['GET'])
+def recipe_duplicates():
+    index = get_duplicate_index()
+    return jsonify({"threshold": index.threshold, "clusters": index.clusters()})
+
+
+@app.route('/api/recipes/<string:identifier>/similar', methods=['GET'])
+def similar_recipes(identifier: str):
+    index = get_similarity_index()
+    position = index.position(identifier)
+    if position is None:
+        return jsonify({"error": "Recipe not found"}), 404
+
+    try:
+        k = int(request.args.get('k', SIMILAR_LIMIT))
+    except ValueError:
+        return jsonify({"error": "'k' must be an integer"}), 400
+    k = min(max(k, 1), 50)
+
+    return jsonify({
+        "recipe": index.recipes[position]["name"],
+        "similar": index.similar(identifier, k),
+    })
+
+
 @app.route('/api/recipes', methods=['POST'])
 def create_recipe_api():
     try:
@@ -1103,6 +2214,7 @@ def create_recipe_api():
 
     try:
         recipe_payload = build_recipe_from_payload(payload)
+        duplicates = get_duplicate_index().duplicates_of(recipe_payload["ingredienser"])
         recipe = create_recipe_record(recipe_payload)
     except ValueError as exc:
         return jsonify({"error": str(exc)}), 400
@@ -1118,6 +2230,7 @@ def create_recipe_api():
         "message": "Recipe created",
         "recipe": serialise_recipe(recipe),
         "recipes": [r.navn for r in recipes],
+        "duplicates": duplicates,
     }), 201
 
 
@@ -1167,6 +2280,14 @@ def update_recipe(identifier: str):
             return jsonify({"error": "'slug' cannot be empty"}), 400
         updates['slug'] = new_slug
 
+    # other fields do not affect the graph, which then carries over unchanged
+    base_graph = graph = get_recipe_graph()
+    if {'navn', 'slug', 'antal', 'ingredienser', 'extras'} & updates.keys():
+        try:
+            graph = base_graph.with_recipe({**serialise_recipe(recipe), **updates}, replaces=recipe.navn)
+        except RecipeCycleError as exc:
+            return jsonify({"error": str(exc)}), 400
+
     with get_session() as session:
         db_recipe = session.exec(
             select(Recipe).where(Recipe.id == recipe.id)
@@ -1189,8 +2310,23 @@ def update_recipe(identifier: str):
         for key, value in updates.items():
             setattr(db_recipe, key, value)
         session.add(db_recipe)
+        _sync_recipe_indexes(session, db_recipe)
+        version = bump_version(session, RECIPES_VERSION_KEY)
         session.commit()
         session.refresh(db_recipe)
+        _update_typeahead(
+            version,
+            removed=recipe.navn if _recipe_visible(recipe) else None,
+            added=db_recipe.navn if _recipe_visible(db_recipe) else None,
+        )
+        _update_ingredient_names(
+            RECIPES_VERSION_KEY,
+            version,
+            removed=_recipe_ingredient_names(recipe),
+            added=_recipe_ingredient_names(db_recipe),
+        )
+        _update_duplicates(version, removed=[recipe.navn], added=[db_recipe])
+        _update_recipe_graph(version, base_graph, graph)
 
     refreshed_identifier = updates.get('slug', identifier)
     refreshed = fetch_recipe_by_identifier(refreshed_identifier)
@@ -1232,7 +2368,8 @@ def create_recipe_from_image():
         "raw_yaml": raw_yaml,
     }
 
-    return jsonify({"recipe": response_payload})
+    duplicates = get_duplicate_index().duplicates_of(recipe_payload["ingredienser"])
+    return jsonify({"recipe": response_payload, "duplicates": duplicates})
 
 
 @app.route('/api/config', methods=['GET'])
@@ -1265,7 +2402,9 @@ def create_category_api():
 
         category = CategoryConfig(name=name, priority=priority)
         session.add(category)
+        version = bump_version(session, CONFIG_VERSION_KEY)
         session.commit()
+    _update_ingredient_names(CONFIG_VERSION_KEY, version)
 
     return jsonify(build_config_payload()), 201
 
@@ -1315,6 +2454,7 @@ def create_staple_api():
             return jsonify({"error": "Staple already exists"}), 400
         staple = StapleItem(name=name, amount=amount_value, unit=unit)
         session.add(staple)
+        bump_version(session, STAPLES_VERSION_KEY)
         session.commit()
         session.refresh(staple)
 
@@ -1356,6 +2496,7 @@ def update_staple_api(item_id: int):
         if unit is not None:
             staple.unit = unit
         session.add(staple)
+        bump_version(session, STAPLES_VERSION_KEY)
         session.commit()
         session.refresh(staple)
 
@@ -1372,6 +2513,7 @@ def delete_staple_api(item_id: int):
         if not staple:
             return jsonify({"error": "Staple not found"}), 404
         session.delete(staple)
+        bump_version(session, STAPLES_VERSION_KEY)
         session.commit()
 
     return jsonify(staples_response())
@@ -1431,7 +2573,9 @@ def update_category_api(category_id: int):
                 return jsonify({"error": "Priority must be an integer"}), 400
 
         session.add(category)
+        version = bump_version(session, CONFIG_VERSION_KEY)
         session.commit()
+    _update_ingredient_names(CONFIG_VERSION_KEY, version)
 
     return jsonify(build_config_payload())
 
@@ -1450,7 +2594,9 @@ def delete_category_api(category_id: int):
             return jsonify({"error": "Remove ingredient mappings before deleting this category"}), 400
 
         session.delete(category)
+        version = bump_version(session, CONFIG_VERSION_KEY)
         session.commit()
+    _update_ingredient_names(CONFIG_VERSION_KEY, version)
 
     return jsonify(build_config_payload())
 
@@ -1485,7 +2631,9 @@ def create_ingredient_config():
 
         item = IngredientConfig(name=name, category_id=category_id)
         session.add(item)
+        version = bump_version(session, CONFIG_VERSION_KEY)
         session.commit()
+    _update_ingredient_names(CONFIG_VERSION_KEY, version, added=[name])
 
     return jsonify(build_config_payload()), 201
 
@@ -1501,6 +2649,7 @@ def update_ingredient_config(item_id: int):
         item = session.get(IngredientConfig, item_id)
         if not item:
             return jsonify({"error": "Ingredient mapping not found"}), 404
+        previous_name = item.name
 
         if 'name' in payload:
             new_name = (payload['name'] or '').strip()
@@ -1527,7 +2676,10 @@ def update_ingredient_config(item_id: int):
             item.category_id = new_category_id
 
         session.add(item)
+        version = bump_version(session, CONFIG_VERSION_KEY)
         session.commit()
+        new_name = item.name
+    _update_ingredient_names(CONFIG_VERSION_KEY, version, removed=[previous_name], added=[new_name])
 
     return jsonify(build_config_payload())
 
@@ -1538,8 +2690,11 @@ def delete_ingredient_config(item_id: int):
         item = session.get(IngredientConfig, item_id)
         if not item:
             return jsonify({"error": "Ingredient mapping not found"}), 404
+        removed_name = item.name
         session.delete(item)
+        version = bump_version(session, CONFIG_VERSION_KEY)
         session.commit()
+    _update_ingredient_names(CONFIG_VERSION_KEY, version, removed=[removed_name])
 
     return jsonify(build_config_payload())
 
@@ -1547,10 +2702,12 @@ def delete_ingredient_config(item_id: int):
 def save_menu(menu_dict: Dict[str, Any]) -> pathlib.Path:
     s = yaml.dump(menu_dict, allow_unicode=True, sort_keys=False)
     isodate = datetime.date.today().isocalendar()
-    recipe_file = pathlib.Path(f"uge_{isodate.week+1}_{isodate.year}.yaml")
+    history_dir = menu_history_dir()
+    history_dir.mkdir(parents=True, exist_ok=True)
+    recipe_file = history_dir / f"uge_{isodate.week+1}_{isodate.year}.yaml"
     i = 1
     while recipe_file.exists():
-        recipe_file = pathlib.Path(f"uge_{isodate.week+1}_{isodate.year}({i}).yaml")
+        recipe_file = history_dir / f"uge_{isodate.week+1}_{isodate.year}({i}).yaml"
         i += 1
 
     with recipe_file.open("w", encoding="utf-8") as f:
@@ -1560,14 +2717,26 @@ def save_menu(menu_dict: Dict[str, Any]) -> pathlib.Path:
 
 
 class MenuText:
+    """Collects printed lines and joins them once instead of per ``add``."""
 
     def __init__(self, menu: str = "") -> None:
-        self.text = menu
+        self.lines: list[str] = [menu] if menu else []
+        self._text: str | None = None
 
     def add(self, s: str) -> None:
-        self.text += s + "\n"
-        with open("shopping.md", "w", encoding="utf-8") as f:
-            f.write(self.text)
+        self.lines.append(s + "\n")
+        self._text = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = "".join(self.lines)
+        return self._text
+
+    def write(self, path: str | pathlib.Path = "shopping.md") -> pathlib.Path:
+        target = pathlib.Path(path)
+        target.write_text(self.text, encoding="utf-8")
+        return target
 
     def __str__(self) -> str:
         return self.text
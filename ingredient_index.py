@@ -0,0 +1,285 @@
+"""Ingredient → recipe bitsets for "cook with what I have" lookups.
+
+Every recipe gets a bit position; every (folded) ingredient name maps to an
+``int`` with the bits of the recipes that use it. A query ORs the bitsets of
+the ingredients at hand to find candidates and adds them up with a bit-sliced
+counter, so the per-recipe match counts fall out of a handful of big-int
+operations per ingredient instead of a scan over every recipe's JSON.
+
+``IngredientNameIndex`` serves ``/api/ingredients/similar``: a BK-tree over
+the lower-cased ingredient name pool under InDel distance (the edit distance
+behind ``fuzz.ratio``), one tree per name length so every length is searched
+with the exact radius "ratio ≥ 70" allows, and only subtrees whose distance
+band can still contain a match are visited.
+
+``ingredient_clusters`` groups the whole pool into likely duplicates for the
+clean-up report: folded names are reduced to a plural-stripped stem, and stems
+are only compared when they share a reasonably rare trigram (blocking), so the
+report never scores all pairs.
+"""
+import threading
+from collections import Counter
+
+from fuzzywuzzy import fuzz
+from Levenshtein import distance
+
+from recipe_search import fold_text
+
+BY_INGREDIENTS_LIMIT = 20
+SIMILAR_NAME_SCORE = 70
+CLUSTER_SCORE = 90
+# trigrams shared by more stems than this are too common to block on
+_CLUSTER_BLOCK_LIMIT = 100
+# longest first; Danish plural and definite endings ("s" would strip "-mos", "-ris")
+_PLURAL_SUFFIXES = ("erne", "ene", "er", "en", "e", "r")
+# fuzz.ratio rounds, so 69.5 already scores 70; a little slack keeps the
+# search radius an upper bound despite float error
+_MIN_RATIO = (SIMILAR_NAME_SCORE - 0.5) / 100 - 1e-6
+
+
+class IngredientBitsetIndex:
+    """Bitset inverted index over ``(navn, slug, ingredient names)`` triples."""
+
+    def __init__(self, recipes):
+        self.recipes = []
+        self.bits = {}
+        for navn, slug, ingredients in recipes:
+            position = len(self.recipes)
+            folded = {}
+            for ingredient in ingredients:
+                folded.setdefault(fold_text(ingredient), ingredient)
+            self.recipes.append({"name": navn, "slug": slug, "ingredients": folded})
+            for key in folded:
+                self.bits[key] = self.bits.get(key, 0) | (1 << position)
+
+    @staticmethod
+    def _count_planes(bitsets):
+        """Sum bitsets into binary counter planes (plane ``n`` holds bit ``n`` of each count)."""
+        planes = []
+        for carry in bitsets:
+            for level, plane in enumerate(planes):
+                planes[level], carry = plane ^ carry, plane & carry
+                if not carry:
+                    break
+            if carry:
+                planes.append(carry)
+        return planes
+
+    def match(self, ingredients, limit=BY_INGREDIENTS_LIMIT, max_missing=None):
+        """Rank recipes by the share of their ingredients found in ``ingredients``.
+
+        Returns ``(matches, unknown)``: match dicts ordered by coverage, then
+        fewest missing, then name; and the query names no recipe uses.
+        """
+        have = {}
+        for ingredient in ingredients:
+            key = fold_text(ingredient)
+            if key:
+                have.setdefault(key, ingredient)
+        unknown = [name for key, name in have.items() if key not in self.bits]
+
+        bitsets = [self.bits[key] for key in have if key in self.bits]
+        planes = self._count_planes(bitsets)
+        candidates = 0
+        for bits in bitsets:
+            candidates |= bits
+
+        matches = []
+        while candidates:
+            lowest = candidates & -candidates
+            position = lowest.bit_length() - 1
+            candidates ^= lowest
+
+            recipe = self.recipes[position]
+            matched = sum(1 << level for level, plane in enumerate(planes) if plane >> position & 1)
+            missing = [name for key, name in recipe["ingredients"].items() if key not in have]
+            if max_missing is not None and len(missing) > max_missing:
+                continue
+            matches.append({
+                "name": recipe["name"],
+                "slug": recipe["slug"],
+                "coverage": matched / len(recipe["ingredients"]),
+                "matched": [name for key, name in recipe["ingredients"].items() if key in have],
+                "missing": missing,
+            })
+
+        matches.sort(key=lambda match: (-match["coverage"], len(match["missing"]), match["name"]))
+        return matches[:limit], unknown
+
+
+def indel_distance(left, right):
+    """Insertions + deletions only; ``ratio = 1 - d / (len(left) + len(right))``."""
+    return distance(left, right, weights=(1, 1, 2))
+
+
+class BKTree:
+    """Burkhard–Keller tree of strings under ``indel_distance``."""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, key):
+        if self.root is None:
+            self.root = (key, {})
+            self.size = 1
+            return
+        node = self.root
+        while True:
+            node_key, children = node
+            step = indel_distance(key, node_key)
+            if step == 0:
+                return
+            child = children.get(step)
+            if child is None:
+                children[step] = (key, {})
+                self.size += 1
+                return
+            node = child
+
+    def within(self, key, radius):
+        """Yield ``(candidate, distance)`` for every key at most ``radius`` away."""
+        if self.root is None:
+            return
+        stack = [self.root]
+        while stack:
+            node_key, children = stack.pop()
+            step = indel_distance(key, node_key)
+            if step <= radius:
+                yield node_key, step
+            for child_step, child in children.items():
+                if step - radius <= child_step <= step + radius:
+                    stack.append(child)
+
+
+class IngredientNameIndex:
+    """Reference-counted pool of ingredient names with a BK-tree for lookups.
+
+    Names come from ingredient config items and recipe ``ingredienser`` /
+    ``extras`` keys; ``update`` keeps per-name reference counts so the pool
+    can follow individual writes. The tree only grows: lower-cased keys
+    whose names all dropped out stay in it and are skipped when matched.
+    """
+
+    def __init__(self, names=()):
+        # one tree per key length, so each length gets its own exact radius
+        self.trees = {}
+        self._names = {}
+        self._lock = threading.Lock()
+        self.update(added=names)
+
+    def update(self, removed=(), added=()):
+        with self._lock:
+            for name in removed:
+                counts = self._names.get((name or "").lower())
+                if counts and counts[name] > 0:
+                    counts[name] -= 1
+                    if counts[name] <= 0:
+                        del counts[name]
+            for name in added:
+                if not name:
+                    continue
+                key = name.lower()
+                counts = self._names.get(key)
+                if counts is None:
+                    counts = self._names[key] = Counter()
+                    self.trees.setdefault(len(key), BKTree()).add(key)
+                counts[name] += 1
+
+    def similar(self, name, limit=10):
+        """Names other than ``name`` with ``fuzz.ratio >= 70``, best first."""
+        query = name.lower()
+        scored = []
+        with self._lock:
+            for length, tree in self.trees.items():
+                # ratio >= t  <=>  d <= (1 - t) * (len(query) + length)
+                radius = int((1 - _MIN_RATIO) * (len(query) + length))
+                if abs(len(query) - length) > radius:
+                    continue
+                scored.extend(self._scored(query, tree.within(query, radius)))
+        scored.sort()
+        return [candidate for _, candidate in scored[:limit]]
+
+    def _scored(self, query, keys):
+        for key, _ in keys:
+            if key == query:
+                continue
+            score = fuzz.ratio(query, key)
+            if score >= SIMILAR_NAME_SCORE:
+                for candidate in self._names[key]:
+                    yield -score, candidate
+
+
+def name_stem(name):
+    """Folded ``name`` with a plural ending stripped from its last word."""
+    head, _, last = fold_text(name).rpartition(" ")
+    for suffix in _PLURAL_SUFFIXES:
+        if last.endswith(suffix) and len(last) - len(suffix) >= 3:
+            last = last[:-len(suffix)]
+            break
+    return f"{head} {last}" if head else last
+
+
+def _trigrams(key):
+    padded = f" {key} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+def ingredient_clusters(usage, score=CLUSTER_SCORE):
+    """Group ``{name: usage count}`` into likely-duplicate clusters.
+
+    Names sharing a stem (case, diacritic and plural variants) always group;
+    stems are linked when they share a trigram no more common than
+    ``_CLUSTER_BLOCK_LIMIT`` and their ``fuzz.ratio`` is at least ``score``.
+    Each cluster suggests the most used name as canonical; clusters come
+    most used first.
+    """
+    by_stem = {}
+    for name in usage:
+        stem = name_stem(name)
+        if stem:
+            by_stem.setdefault(stem, []).append(name)
+    stems = list(by_stem)
+    parent = list(range(len(stems)))
+
+    def find(position):
+        while parent[position] != position:
+            parent[position] = parent[parent[position]]
+            position = parent[position]
+        return position
+
+    blocks = {}
+    for position, stem in enumerate(stems):
+        for gram in _trigrams(stem):
+            blocks.setdefault(gram, []).append(position)
+    checked = set()
+    for members in blocks.values():
+        if len(members) > _CLUSTER_BLOCK_LIMIT:
+            continue
+        for index, left in enumerate(members):
+            for right in members[index + 1:]:
+                if (left, right) in checked:
+                    continue
+                checked.add((left, right))
+                a, b = stems[left], stems[right]
+                # ratio >= score needs the lengths within that share of the total
+                if abs(len(a) - len(b)) > (1 - score / 100) * (len(a) + len(b)):
+                    continue
+                if fuzz.ratio(a, b) >= score:
+                    parent[find(right)] = find(left)
+
+    groups = {}
+    for position, stem in enumerate(stems):
+        groups.setdefault(find(position), []).extend(by_stem[stem])
+    clusters = []
+    for names in groups.values():
+        if len(names) < 2:
+            continue
+        names.sort(key=lambda name: (-usage[name], len(name), name))
+        clusters.append({
+            "canonical": names[0],
+            "usage": sum(usage[name] for name in names),
+            "names": [{"name": name, "usage": usage[name]} for name in names],
+        })
+    clusters.sort(key=lambda cluster: (-cluster["usage"], cluster["canonical"]))
+    return clusters
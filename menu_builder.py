@@ -0,0 +1,480 @@
+"""Pure menu → shopping list pipeline.
+
+``expand_menu`` takes the structured menu (section name → list of recipe
+entries, the same shape as the ``menus/uge_*.yaml`` files) and expands it into
+a :class:`MenuResult` without touching the filesystem. Markdown, CSV and plain
+text are rendered from that result on request; ``build_menu`` keeps the
+original print-as-you-go ``printer=`` contract. Writing YAML snapshots or
+markdown files is left to the callers (``parser`` CLI, Flask).
+"""
+import csv
+import io
+import pathlib
+import sys
+from collections import Counter
+from types import MappingProxyType
+
+import yaml
+from sqlalchemy import or_
+from sqlmodel import select
+
+from src.models import (
+    CONFIG_VERSION_KEY,
+    CategoryConfig,
+    IngredientConfig,
+    Recipe,
+    get_session,
+    get_version,
+)
+
+# (config version, read-only config) shared by every menu built in this process
+_config_snapshot = None
+
+
+class ShoppingLine:
+    """One aggregated ingredient on the shopping list.
+
+    ``amounts`` maps unit → total amount; ``recipes`` counts how many
+    contributions each recipe made to the line.
+    """
+
+    __slots__ = ("name", "category", "priority", "amounts", "recipes")
+
+    def __init__(self, name, category, priority):
+        self.name = sys.intern(name)
+        self.category = category
+        self.priority = priority
+        self.amounts = {}
+        self.recipes = Counter()
+
+    def add(self, unit, amount, recipe_name=None):
+        self.amounts[unit] = self.amounts.get(unit, 0.0) + amount
+        if recipe_name is not None:
+            self.recipes[sys.intern(recipe_name)] += 1
+
+    def merge(self, other):
+        for unit, amount in other.amounts.items():
+            self.amounts[unit] = self.amounts.get(unit, 0.0) + amount
+        self.recipes.update(other.recipes)
+
+    def subtract(self, other):
+        """Remove ``other``'s contribution; units that reach zero are dropped."""
+        for unit, amount in other.amounts.items():
+            remaining = self.amounts.get(unit, 0.0) - amount
+            if abs(remaining) < 1e-9:
+                self.amounts.pop(unit, None)
+            else:
+                self.amounts[unit] = remaining
+        self.recipes -= other.recipes
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "category": self.category,
+            "priority": self.priority,
+            "amounts": dict(self.amounts),
+            "recipes": sorted(self.recipes),
+        }
+
+    def __repr__(self):
+        return f"ShoppingLine({self.name!r}, {self.amounts!r})"
+
+
+def shopping_line(shopping, ingrediens, config):
+    """Return the line for ``ingrediens`` in ``shopping``, creating it if needed."""
+    category = config["varer"].get(ingrediens, "unknown")
+    priority = config["kategorier"][category]
+    line = shopping.get((priority, ingrediens))
+    if line is None:
+        line = shopping[priority, ingrediens] = ShoppingLine(ingrediens, category, priority)
+    return line
+
+
+def add_ingredient(ingrediens, amount, shopping, config, recipe_name):
+    shopping_line(shopping, ingrediens, config).add(amount["unit"], amount["amount"], recipe_name)
+
+
+def _recipe_data(db_recipe):
+    return {
+        "navn": db_recipe.navn,
+        "placering": db_recipe.placering,
+        "antal": db_recipe.antal,
+        "ingredienser": db_recipe.ingredienser or {},
+        "extras": db_recipe.extras or {},
+    }
+
+
+def load_recipe_data(identifier):
+    with get_session() as session:
+        statement = select(Recipe).where(
+            or_(Recipe.slug == identifier, Recipe.navn == identifier)
+        )
+        db_recipe = session.exec(statement).first()
+
+    if db_recipe:
+        return _recipe_data(db_recipe)
+
+    recipe_pth = pathlib.Path.cwd() / f"recipes/{identifier}.yml"
+    with recipe_pth.open("r") as f:
+        return yaml.load(f, Loader=yaml.FullLoader)
+
+
+def _legacy_recipe_files():
+    recipe_dir = pathlib.Path.cwd() / "recipes"
+    if not recipe_dir.is_dir():
+        return {}
+    return {path.stem: path for path in recipe_dir.glob("*.yml")}
+
+
+def prefetch_recipes(identifiers):
+    """Resolve every recipe reachable from ``identifiers`` up front.
+
+    Follows ``extras`` level by level with one ``IN`` query per level, so a
+    whole menu (dinners, their extras and the staples) costs one query per
+    nesting depth instead of one per entry. Identifiers that are neither in
+    the database nor in ``recipes/*.yml`` map to ``None`` — plain ingredients.
+    """
+    resolved = {}
+    legacy_files = None
+    pending = {identifier for identifier in identifiers if identifier}
+
+    with get_session() as session:
+        while pending:
+            rows = session.exec(
+                select(Recipe).where(
+                    or_(Recipe.slug.in_(pending), Recipe.navn.in_(pending))
+                )
+            ).all()
+            by_slug = {row.slug: row for row in rows}
+            by_name = {row.navn: row for row in rows}
+
+            discovered = set()
+            for identifier in pending:
+                db_recipe = by_slug.get(identifier) or by_name.get(identifier)
+                if db_recipe:
+                    recipe = _recipe_data(db_recipe)
+                else:
+                    if legacy_files is None:
+                        legacy_files = _legacy_recipe_files()
+                    recipe_pth = legacy_files.get(identifier)
+                    recipe = None
+                    if recipe_pth is not None:
+                        with recipe_pth.open("r") as f:
+                            recipe = yaml.load(f, Loader=yaml.FullLoader)
+                resolved[identifier] = recipe
+                if recipe:
+                    discovered.update((recipe.get("extras") or {}).keys())
+
+            pending = {name for name in discovered if name and name not in resolved}
+
+    return resolved
+
+
+def load_config_from_db():
+    with get_session() as session:
+        categories = session.exec(select(CategoryConfig)).all()
+        if not categories:
+            raise LookupError
+        items = session.exec(select(IngredientConfig)).all()
+
+    config = {
+        "kategorier": {category.name: category.priority for category in categories},
+        "varer": {},
+    }
+
+    category_lookup = {category.id: category.name for category in categories}
+    for item in items:
+        category_name = category_lookup.get(item.category_id)
+        if category_name:
+            config["varer"][item.name] = category_name
+
+    return config
+
+
+def load_config():
+    """Return the category config, reloading only after a config write.
+
+    The version is read before the tables, so a concurrent write can at worst
+    make the next call reload once more; it never pins stale data.
+    """
+    global _config_snapshot
+    with get_session() as session:
+        version = get_version(session, CONFIG_VERSION_KEY)
+
+    snapshot = _config_snapshot
+    if snapshot is not None and snapshot[0] == version:
+        return snapshot[1]
+
+    try:
+        config = load_config_from_db()
+    except LookupError:
+        raise RuntimeError(
+            "No categories found in the database. Seed data via the /api/config endpoints before generating menus."
+        ) from None
+
+    config = MappingProxyType({
+        "kategorier": MappingProxyType(config["kategorier"]),
+        "varer": MappingProxyType(config["varer"]),
+    })
+    _config_snapshot = (version, config)
+    return config
+
+
+def recipe_multiplier(recipe, amount):
+    if amount["unit"] == "recipe":
+        return amount["amount"]
+    base_servings = float(recipe.get("antal") or 0)
+    return amount["amount"]/base_servings if base_servings > 0 else 0
+
+
+def add_recipe(recipe_identifier, amount, shopping, config, silent=False, printer=print, recipes=None, trail=(), listing=None):
+    if recipes is None:
+        recipe = load_recipe_data(recipe_identifier)
+    else:
+        recipe = recipes.get(recipe_identifier)
+        if recipe is None:
+            raise FileNotFoundError(recipe_identifier)
+
+    if recipe["navn"] in trail:
+        raise ValueError(f"Recipe extras form a cycle through '{recipe['navn']}'")
+    trail = trail + (recipe["navn"],)
+
+    multiplier = recipe_multiplier(recipe, amount)
+
+    if not silent:
+        entry = {
+            "name": recipe["navn"],
+            "multiplier": multiplier,
+            "placering": recipe.get("placering") or "",
+        }
+        if listing is not None:
+            listing.append(entry)
+        if printer is not None:
+            printer(recipe_line(entry))
+
+    for ingrediens, amount in recipe["ingredienser"].items():
+        # Scale a copy: prefetched recipes are shared between menu entries
+        amount = {**amount, "amount": amount["amount"] * multiplier}
+        if amount["amount"]>0:
+            add_ingredient(ingrediens, amount, shopping, config, recipe['navn'])
+
+    for ingrediens, amount in (recipe.get("extras") or {}).items():
+        try:
+            add_recipe(
+                ingrediens, amount, shopping, config,
+                silent=silent, printer=printer, recipes=recipes, trail=trail, listing=listing,
+            )
+        except FileNotFoundError:
+            if amount["amount"] > 0:
+                add_ingredient(ingrediens, amount, shopping, config, recipe['navn'])
+
+
+def recipe_line(entry):
+    multiplier = entry["multiplier"]
+    if multiplier == 1:
+        amount_str = ""
+    else:
+        amount_str = f"(x{multiplier:g})" if multiplier else "(fryser)"
+
+    return f" - {entry['name']:35s}  {amount_str} : {entry['placering']:25s}"
+
+
+def amount_string(line):
+    to_str = lambda v: f"{v:.2f}".rstrip('0').rstrip('.')
+    a = [f"{to_str(amount)} {unit:<6s}" for unit, amount in line.amounts.items()]
+
+    amounts_str = " + ".join(a)
+
+    max_len = 12
+    included_in = sorted(line.recipes)
+
+    included_in_more_than_self = len(included_in)>1
+    if included_in_more_than_self:
+        # eg ingredient == apple : [apple, dish-w-apple, other-dish-w-apple] -> [dish-w-apple, other-dish-w-apple]
+        # then don't include self
+        included_in = [s for s in included_in if not s == line.name]
+
+    # [dish-w-apple, other-dish-w-apple] -> [dish-w-app, other-dish]
+    included_in = [s[:max_len] for s in included_in]
+
+    recs_str = f"{' + '.join(included_in)}"
+
+    return amounts_str, recs_str
+
+
+def print_shopping(shopping, printer=print):
+    """
+
+    |          |          |       |
+    |----------|----------|------:|
+    | **agurk**    | 1 stk    | agurk |
+
+
+    """
+    prev_priority = None
+    new_table = """
+
+|          |          |       |
+|----------|----------|------:|"""
+    for priority, ingrediens in sorted(shopping):
+        if not (priority == prev_priority):
+            printer(new_table)
+        prev_priority = priority
+        amounts_str, recs_str = amount_string(shopping[priority, ingrediens])
+        max_recs_len = 30
+        printer(f"| {ingrediens:40s} | {amounts_str:>10s} |  {recs_str[:max_recs_len]:30s}  | ")
+
+
+def menu_entry(entry):
+    if isinstance(entry, str):
+        entry = {entry: {"amount": 1, "unit": "recipe"}}
+    recipe_name, = entry.keys()
+    return recipe_name, entry[recipe_name]
+
+
+def menu_identifiers(menu):
+    return {menu_entry(entry)[0] for entries in menu.values() for entry in entries}
+
+
+class MenuResult:
+    """Structured outcome of a menu expansion, rendered on demand.
+
+    ``sections`` lists the printed menu sections with the recipes (including
+    expanded sub-recipes) under each; ``shopping`` is the line mapping that
+    :func:`print_shopping` renders.
+    """
+
+    __slots__ = ("sections", "shopping", "_rendered")
+
+    def __init__(self, sections, shopping):
+        self.sections = sections
+        self.shopping = shopping
+        self._rendered = {}
+
+    def render(self, output_format):
+        """Render via ``RENDERERS[output_format]``, memoized per result."""
+        rendered = self._rendered.get(output_format)
+        if rendered is None:
+            rendered = self._rendered[output_format] = RENDERERS[output_format](self)
+        return rendered
+
+    def categories(self):
+        """Group shopping lines by category in priority order."""
+        categories = []
+        for key in sorted(self.shopping):
+            line = self.shopping[key]
+            if not categories or categories[-1]["priority"] != line.priority:
+                categories.append({"category": line.category, "priority": line.priority, "items": []})
+            categories[-1]["items"].append({
+                "name": line.name,
+                "amounts": dict(line.amounts),
+                "recipes": sorted(line.recipes),
+            })
+        return categories
+
+    def to_dict(self):
+        return {"menu": self.sections, "shopping": self.categories()}
+
+
+def expand_menu(menu, config=None, recipes=None):
+    """Expand ``menu`` into a :class:`MenuResult` without rendering anything.
+
+    ``menu`` maps section names to lists of recipe entries, either a bare
+    identifier or ``{identifier: {"amount": ..., "unit": ...}}``. ``recipes``
+    is an optional :func:`prefetch_recipes` result; it is fetched here when
+    omitted.
+    """
+    if config is None:
+        config = load_config()
+    if recipes is None:
+        recipes = prefetch_recipes(menu_identifiers(menu))
+
+    shopping = {}
+    sections = []
+    for name, entries in menu.items():
+        silent = name.lower() == "andet"
+        listing = []
+        if not silent:
+            sections.append({"name": name, "recipes": listing})
+        for entry in entries:
+            recipe_name, amount = menu_entry(entry)
+            try:
+                add_recipe(
+                    recipe_name, amount, shopping, config,
+                    silent=silent, printer=None, recipes=recipes, listing=listing,
+                )
+            except FileNotFoundError:
+                if amount["amount"] > 0:
+                    add_ingredient(recipe_name, amount, shopping, config, recipe_name)
+
+    return MenuResult(sections, shopping)
+
+
+def merge_results(results):
+    """Combine several menus into one shopping list, e.g. for a single big shop."""
+    sections = []
+    shopping = {}
+    for result in results:
+        sections.extend(result.sections)
+        for key, line in result.shopping.items():
+            combined = shopping.get(key)
+            if combined is None:
+                combined = shopping[key] = ShoppingLine(line.name, line.category, line.priority)
+            combined.merge(line)
+    return MenuResult(sections, shopping)
+
+
+def print_menu(result, printer=print):
+    printer("# Menu")
+    for section in result.sections:
+        printer("## " + section["name"])
+        for entry in section["recipes"]:
+            printer(recipe_line(entry))
+
+    printer("# Shopping")
+    print_shopping(result.shopping, printer=printer)
+
+
+def render_markdown(result):
+    lines = []
+    print_menu(result, printer=lines.append)
+    return "".join(f"{line}\n" for line in lines)
+
+
+def render_csv(result):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["category", "name", "amount", "unit", "recipes"])
+    for category in result.categories():
+        for item in category["items"]:
+            for unit, amount in item["amounts"].items():
+                writer.writerow([category["category"], item["name"], f"{amount:g}", unit, " + ".join(item["recipes"])])
+    return buffer.getvalue()
+
+
+def render_text(result):
+    lines = []
+    for category in result.categories():
+        lines.append(category["category"])
+        for item in category["items"]:
+            amounts = " + ".join(f"{amount:g} {unit}".strip() for unit, amount in item["amounts"].items())
+            lines.append(f"  {item['name']}: {amounts}")
+    return "".join(f"{line}\n" for line in lines)
+
+
+RENDERERS = {
+    "markdown": render_markdown,
+    "csv": render_csv,
+    "text": render_text,
+}
+
+
+def build_menu(menu, printer=print, config=None, recipes=None):
+    """Expand ``menu`` and print menu + shopping list via ``printer``.
+
+    Returns the shopping mapping of ``(priority, ingrediens)`` to
+    :class:`ShoppingLine`; see :func:`expand_menu` for the arguments.
+    """
+    result = expand_menu(menu, config=config, recipes=recipes)
+    print_menu(result, printer=printer)
+    return result.shopping
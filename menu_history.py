@@ -0,0 +1,104 @@
+"""Popularity of recipes derived from the saved weekly menus in ``menus/``.
+
+Every dish planned with a positive amount counts as cooked in the week the
+file is named after (``uge_07_2023.yaml``; files without a week number, such
+as ``vinterferie_2021.yaml``, count from the first week of their year). Each
+appearance adds ``0.5 ** (age / HALF_LIFE_DAYS)`` relative to the newest menu,
+so recent favourites outrank dishes that were popular years ago, and the sums
+are scaled to ``0..1``. Only planned dishes count: the silent "Andet" section,
+sections holding the weekly staples and the staples themselves are skipped.
+"""
+import datetime
+import pathlib
+import re
+
+import yaml
+
+from menu_builder import menu_entry
+
+HALF_LIFE_DAYS = 365
+# the history is ~140 files; the libyaml loader parses it several times faster
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+_WEEK_FILE = re.compile(r"uge_(\d{1,2})_(\d{4})")
+_YEAR = re.compile(r"(\d{4})")
+
+
+def menu_date(path):
+    """Monday of the week a menu file is named after, or ``None``."""
+    stem = pathlib.Path(path).stem
+    match = _WEEK_FILE.search(stem)
+    if match:
+        week, year = int(match.group(1)), int(match.group(2))
+        try:
+            return datetime.date.fromisocalendar(year, max(week, 1), 1)
+        except ValueError:
+            return datetime.date.fromisocalendar(year, 52, 1)
+    match = _YEAR.search(stem)
+    return datetime.date(int(match.group(1)), 1, 1) if match else None
+
+
+def load_history(menu_dir="menus"):
+    """Return ``[(date, menu), ...]`` for every readable dated menu file."""
+    history = []
+    for path in sorted(pathlib.Path(menu_dir).glob("*.y*ml")):
+        date = menu_date(path)
+        if date is None:
+            continue
+        try:
+            menu = yaml.load(path.read_text(encoding="utf-8"), Loader=_Loader) or {}
+        except (OSError, yaml.YAMLError):
+            continue
+        if isinstance(menu, dict):
+            history.append((date, menu))
+    return history
+
+
+def cooked_dishes(menu, staple_sections=(), staples=()):
+    """Identifiers planned with a positive amount, once per menu.
+
+    Sections named "Andet" or in ``staple_sections`` and identifiers in
+    ``staples`` are skipped (case-insensitively).
+    """
+    skip_sections = {"andet"} | {name.lower() for name in staple_sections}
+    skip = {name.lower() for name in staples}
+    dishes = set()
+    for name, entries in menu.items():
+        if str(name).lower() in skip_sections:
+            continue
+        for entry in entries or []:
+            try:
+                identifier, amount = menu_entry(entry)
+            except (AttributeError, ValueError):
+                continue
+            if str(identifier).lower() in skip:
+                continue
+            if (amount or {}).get("amount", 1) > 0:
+                dishes.add(identifier)
+    return dishes
+
+
+def popularity(history, resolve=lambda identifier: identifier, staple_sections=(), staples=()):
+    """Aggregate ``history`` into ``{key: {"times_cooked", "last_cooked", "score"}}``.
+
+    ``resolve`` maps a menu identifier to the key to aggregate on (for
+    example a recipe id, so slug and name spellings count together); entries
+    it maps to ``None`` are skipped, as are staples (see ``cooked_dishes``).
+    """
+    if not history:
+        return {}
+    newest = max(date for date, _ in history)
+    totals = {}
+    for date, menu in history:
+        weight = 0.5 ** ((newest - date).days / HALF_LIFE_DAYS)
+        keys = {resolve(identifier) for identifier in cooked_dishes(menu, staple_sections, staples)}
+        for key in keys - {None}:
+            entry = totals.setdefault(key, {"times_cooked": 0, "last_cooked": date, "score": 0.0})
+            entry["times_cooked"] += 1
+            entry["last_cooked"] = max(entry["last_cooked"], date)
+            entry["score"] += weight
+
+    top = max(entry["score"] for entry in totals.values()) if totals else 0.0
+    for entry in totals.values():
+        entry["score"] = entry["score"] / top if top else 0.0
+    return totals
@@ -0,0 +1,106 @@
+"""Server-side menu sessions with incrementally maintained shopping totals.
+
+A session keeps each dish's scaled contribution next to the running
+shopping totals. Adding, removing or re-scaling one dish subtracts/adds only
+that dish's lines, so an edit costs as much as the dish has ingredients
+instead of a full ``expand_menu``.
+"""
+from menu_builder import (
+    MenuResult,
+    ShoppingLine,
+    add_ingredient,
+    add_recipe,
+    menu_entry,
+    prefetch_recipes,
+)
+
+
+class MenuSession:
+
+    def __init__(self, config, staples, versions=None):
+        self.config = config
+        self.versions = versions
+        self.recipes = {}
+        self.shopping = {}
+        self._dishes = {}
+        self._staples_label, staple_entries = staples
+
+        # staples expand exactly as in ``expand_menu``: recipes first, else plain ingredients
+        self._staples = {}
+        self._staples_listing = []
+        self.recipes.update(prefetch_recipes(menu_entry(entry)[0] for entry in staple_entries))
+        for entry in staple_entries:
+            name, amount = menu_entry(entry)
+            try:
+                add_recipe(
+                    name, amount, self._staples, config,
+                    silent=self._staples_label.lower() == "andet", printer=None,
+                    recipes=self.recipes, listing=self._staples_listing,
+                )
+            except FileNotFoundError:
+                if amount["amount"] > 0:
+                    add_ingredient(name, amount, self._staples, config, name)
+        self._has_staples = bool(staple_entries)
+        self._apply(self._staples, 1)
+
+    @property
+    def plates(self):
+        return {navn: dish["plates"] for navn, dish in self._dishes.items()}
+
+    def set_dish(self, navn, identifier, plates):
+        """Add ``navn`` or change its plates; returns the touched line keys."""
+        if identifier not in self.recipes:
+            self.recipes.update(prefetch_recipes([identifier]))
+
+        contribution = {}
+        listing = []
+        add_recipe(
+            identifier, {"amount": plates, "unit": "plates"}, contribution, self.config,
+            printer=None, recipes=self.recipes, listing=listing,
+        )
+
+        touched = set(contribution)
+        previous = self._dishes.get(navn)
+        if previous is not None:
+            self._apply(previous["shopping"], -1)
+            touched.update(previous["shopping"])
+        self._apply(contribution, 1)
+        self._dishes[navn] = {"plates": plates, "listing": listing, "shopping": contribution}
+        return touched
+
+    def remove_dish(self, navn):
+        dish = self._dishes.pop(navn, None)
+        if dish is None:
+            return set()
+        self._apply(dish["shopping"], -1)
+        return set(dish["shopping"])
+
+    def _apply(self, contribution, sign):
+        for key, line in contribution.items():
+            current = self.shopping.get(key)
+            if current is None:
+                current = self.shopping[key] = ShoppingLine(line.name, line.category, line.priority)
+            if sign > 0:
+                current.merge(line)
+            else:
+                current.subtract(line)
+                if not current.amounts:
+                    del self.shopping[key]
+
+    def lines(self, keys):
+        """Current state of ``keys``; lines that dropped to zero are flagged."""
+        changed = []
+        for key in sorted(keys):
+            line = self.shopping.get(key)
+            if line is None:
+                priority, name = key
+                changed.append({"name": name, "priority": priority, "removed": True})
+            else:
+                changed.append(line.to_dict())
+        return changed
+
+    def result(self):
+        sections = [{"name": navn, "recipes": dish["listing"]} for navn, dish in self._dishes.items()]
+        if self._has_staples and self._staples_label.lower() != "andet":
+            sections.append({"name": self._staples_label, "recipes": self._staples_listing})
+        return MenuResult(sections, self.shopping)
@@ -0,0 +1,146 @@
+"""Dependency graph between recipes and their ``extras`` sub-recipes.
+
+An extra whose name resolves to another recipe (by slug or navn) is an edge
+parent → child. The graph is built from the whole catalog, ordered
+topologically and used to
+
+* reject writes that would make a recipe reach itself through its extras, and
+* keep a flattened bill of materials per recipe, computed children-first so
+  shared sub-recipes (``pizzadej``, ``naan``, ``raita``) are expanded once.
+
+BOM semantics follow ``menu_builder.add_recipe``: a recipe's own ingredients
+scale with the plate multiplier, its extras are added as-is.
+"""
+from menu_builder import recipe_multiplier
+
+
+class RecipeCycleError(ValueError):
+    pass
+
+
+class RecipeGraph:
+
+    def __init__(self, recipes):
+        self.recipes = {recipe["navn"]: recipe for recipe in recipes}
+        # slugs win over names, like menu_builder.prefetch_recipes
+        self._aliases = {navn: navn for navn in self.recipes}
+        self._aliases.update(
+            (recipe["slug"], navn) for navn, recipe in self.recipes.items() if recipe.get("slug")
+        )
+
+        self.edges = {
+            navn: [
+                child
+                for child in (self.resolve(name) for name in (recipe.get("extras") or {}))
+                if child is not None
+            ]
+            for navn, recipe in self.recipes.items()
+        }
+        self.order, self.cycles = self._topological_order()
+        self.cyclic = {navn for cycle in self.cycles for navn in cycle}
+
+        self._flattened = {}
+        for navn in self.order:
+            if navn not in self.cyclic and all(child in self._flattened for child in self.edges[navn]):
+                self._flattened[navn] = self._flatten(navn)
+
+    def resolve(self, identifier):
+        return self._aliases.get(identifier)
+
+    def _topological_order(self):
+        """Children before parents; back edges are reported as cycles and skipped."""
+        order = []
+        cycles = []
+        done = set()
+        path = []
+        on_path = set()
+
+        def visit(navn):
+            path.append(navn)
+            on_path.add(navn)
+            for child in self.edges[navn]:
+                if child in on_path:
+                    cycles.append(path[path.index(child):] + [child])
+                elif child not in done:
+                    visit(child)
+            path.pop()
+            on_path.discard(navn)
+            done.add(navn)
+            order.append(navn)
+
+        for navn in sorted(self.recipes):
+            if navn not in done:
+                visit(navn)
+        return order, cycles
+
+    def _flatten(self, navn):
+        """Return ``(own, fixed)`` line lists for one recipe multiplier.
+
+        ``own`` holds ``(name, unit, amount)`` of the recipe's ingredients;
+        ``fixed`` holds ``(name, unit, amount, source recipe)`` of its
+        expanded extras. Children are already flattened (topological order).
+        """
+        recipe = self.recipes[navn]
+        own = [
+            (name, amount["unit"], amount["amount"])
+            for name, amount in (recipe.get("ingredienser") or {}).items()
+        ]
+        fixed = []
+        for name, amount in (recipe.get("extras") or {}).items():
+            child = self.resolve(name)
+            if child is None:
+                if amount["amount"] > 0:
+                    fixed.append((name, amount["unit"], amount["amount"], navn))
+                continue
+            child_own, child_fixed = self._flattened[child]
+            multiplier = recipe_multiplier(self.recipes[child], amount)
+            for child_name, unit, child_amount in child_own:
+                if child_amount * multiplier > 0:
+                    fixed.append((child_name, unit, child_amount * multiplier, child))
+            fixed.extend(child_fixed)
+        return own, fixed
+
+    def cycle_through(self, navn):
+        return next((cycle for cycle in self.cycles if navn in cycle), None)
+
+    def with_recipe(self, recipe, replaces=None):
+        """Return the graph with ``recipe`` added (or replacing ``replaces``).
+
+        Raises ``RecipeCycleError`` when the recipe would reach itself.
+        """
+        recipes = [
+            existing for navn, existing in self.recipes.items()
+            if navn not in (replaces, recipe["navn"])
+        ]
+        graph = RecipeGraph(recipes + [recipe])
+        cycle = graph.cycle_through(recipe["navn"])
+        if cycle:
+            raise RecipeCycleError(f"Extras form a cycle: {' -> '.join(cycle)}")
+        return graph
+
+    def bill_of_materials(self, identifier, amount):
+        """Aggregate the flattened lines of ``identifier`` for ``amount``.
+
+        ``amount`` is a menu amount (``{"amount": 4, "unit": "plates"}``).
+        Returns ``(multiplier, lines)`` where lines are dicts with name, unit,
+        amount and the recipes contributing to them.
+        """
+        navn = self.resolve(identifier)
+        if navn is None:
+            raise KeyError(identifier)
+        if navn not in self._flattened:
+            cycle = self.cycle_through(navn) or self.cycles[0]
+            raise RecipeCycleError(f"Extras form a cycle: {' -> '.join(cycle)}")
+
+        own, fixed = self._flattened[navn]
+        multiplier = recipe_multiplier(self.recipes[navn], amount)
+        lines = {}
+        contributions = [(name, unit, value * multiplier, navn) for name, unit, value in own]
+        for name, unit, value, source in contributions + fixed:
+            if value <= 0:
+                continue
+            line = lines.setdefault((name, unit), {"name": name, "unit": unit, "amount": 0.0, "recipes": []})
+            line["amount"] += value
+            if source not in line["recipes"]:
+                line["recipes"].append(source)
+        return multiplier, list(lines.values())
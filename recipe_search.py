@@ -0,0 +1,228 @@
+"""Candidate index behind ``/api/recipes/search``.
+
+Recipe names and ingredient keys are lower-cased and flattened once into a
+deduplicated candidate list, each candidate mapped back to the recipes that
+contain it. A query is scored against that list in one batched rapidfuzz call
+with a score cutoff; only the survivors are re-scored with fuzzywuzzy so the
+scores (and therefore ordering and ``total_matches``) are the ones the endpoint
+has always returned.
+
+On SQLite the same fields (plus ``placering``) are also mirrored into an FTS5
+trigram table for ``engine=fts``: substring matches ranked by bm25, with only
+the best ``FTS_CANDIDATES`` re-ranked by the fuzzy score.
+
+``TypeaheadIndex`` answers keystroke-level prefix lookups from a sorted array of
+folded name and word suffixes, without any scoring.
+"""
+import heapq
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+
+from fuzzywuzzy import fuzz
+from rapidfuzz import fuzz as rapid_fuzz, process
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlmodel import select
+
+from src.models import Recipe
+
+MATCH_THRESHOLD = 80
+RESULT_LIMIT = 6
+POPULARITY_WEIGHT = 5
+FTS_TABLE = "recipe_fts"
+FTS_CANDIDATES = 50
+# trigram tokens: shorter queries cannot match anything
+FTS_MIN_QUERY = 3
+TYPEAHEAD_LIMIT = 10
+
+# letters NFKD does not decompose; without these "Rødløg" would fold to "rdlg"
+_FOLD_LETTERS = str.maketrans({"ø": "o", "Ø": "O", "æ": "ae", "Æ": "AE", "ß": "ss"})
+
+
+def fold_text(value):
+    """Lower-case, strip and fold ``value`` to ASCII ("Rødløg" -> "rodlog")."""
+    return (
+        unicodedata.normalize("NFKD", (value or "").translate(_FOLD_LETTERS))
+        .encode("ascii", "ignore")
+        .decode("ascii")
+        .lower()
+        .strip()
+    )
+
+
+class RecipeSearchIndex:
+    """Search over ``(navn, ingredient names, popularity)`` triples, kept in display order.
+
+    ``popularity`` (``0..1``, see ``menu_history``) is stored per position and
+    adds up to ``POPULARITY_WEIGHT`` points when ranking matches, so among
+    similar scores the dishes actually cooked most come first. It does not
+    change which recipes match.
+    """
+
+    def __init__(self, recipes):
+        self.names = []
+        self.popularity = []
+        owners = {}
+        for navn, ingredients, popularity in recipes:
+            position = len(self.names)
+            self.names.append(navn)
+            self.popularity.append(popularity)
+            for text in (navn, *ingredients):
+                positions = owners.setdefault(text.lower(), [])
+                if not positions or positions[-1] != position:
+                    positions.append(position)
+        self.candidates = list(owners)
+        self._owners = list(owners.values())
+
+    def search(self, query, limit=RESULT_LIMIT):
+        """Return ``(names, total_matches)`` for a lower-cased, stripped query.
+
+        A recipe scores the best ``partial_ratio`` of its name and ingredients
+        and matches above ``MATCH_THRESHOLD``; matches are ranked by score plus
+        popularity boost, ties keeping display order.
+        """
+        if not query:
+            return self.names[:limit], None
+
+        # rapidfuzz aligns optimally, so its partial_ratio never falls below
+        # fuzzywuzzy's: the cutoff can only drop candidates that cannot match.
+        survivors = process.extract(
+            query,
+            self.candidates,
+            scorer=rapid_fuzz.partial_ratio,
+            score_cutoff=MATCH_THRESHOLD,
+            limit=None,
+        )
+        best = {}
+        for candidate, _, index in survivors:
+            score = fuzz.partial_ratio(query, candidate)
+            if score <= MATCH_THRESHOLD:
+                continue
+            for position in self._owners[index]:
+                if score > best.get(position, 0):
+                    best[position] = score
+
+        popularity = self.popularity
+        top = heapq.nsmallest(
+            limit,
+            best.items(),
+            key=lambda item: (-(item[1] + POPULARITY_WEIGHT * popularity[item[0]]), item[0]),
+        )
+        return [self.names[position] for position, _ in top], len(best)
+
+
+class TypeaheadIndex:
+    """Sorted ``(folded suffix, word position, name)`` entries, one per word start.
+
+    A prefix is two bisections plus a scan of the matching range; names whose
+    start matches rank before names matched on a later word. ``add`` and
+    ``discard`` keep the array sorted so writes never need a rebuild.
+    """
+
+    def __init__(self, names=()):
+        self._entries = sorted(entry for name in names for entry in self._name_entries(name))
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _name_entries(name):
+        folded = fold_text(name)
+        starts = [0] + [index + 1 for index, char in enumerate(folded) if char == " "]
+        return [(folded[start:], position, name) for position, start in enumerate(starts)]
+
+    def add(self, name):
+        with self._lock:
+            for entry in self._name_entries(name):
+                insort(self._entries, entry)
+
+    def discard(self, name):
+        with self._lock:
+            for entry in self._name_entries(name):
+                index = bisect_left(self._entries, entry)
+                if index < len(self._entries) and self._entries[index] == entry:
+                    del self._entries[index]
+
+    def complete(self, prefix, limit=TYPEAHEAD_LIMIT):
+        key = fold_text(prefix)
+        if not key:
+            return []
+        with self._lock:
+            start = bisect_left(self._entries, (key,))
+            # every string starting with ``key`` sorts below key + U+FFFF
+            end = bisect_left(self._entries, (key + "\uffff",), start)
+            matches = self._entries[start:end]
+
+        best = {}
+        for _, position, name in matches:
+            rank = (position > 0, name)
+            if name not in best or rank < best[name]:
+                best[name] = rank
+        return [name for _, name in heapq.nsmallest(limit, best.values())]
+
+
+def init_recipe_fts(session):
+    """Create the FTS table and backfill it; ``False`` when FTS5 is unavailable."""
+    if session.get_bind().dialect.name != "sqlite":
+        return False
+    try:
+        session.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            "USING fts5(navn, placering, ingredienser, tokenize='trigram')"
+        ))
+    except OperationalError:
+        return False
+
+    indexed = session.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar()
+    recipes = session.exec(select(Recipe)).all()
+    if indexed != len(recipes):
+        session.execute(text(f"DELETE FROM {FTS_TABLE}"))
+        for recipe in recipes:
+            sync_recipe_fts(session, recipe)
+    session.commit()
+    return True
+
+
+def sync_recipe_fts(session, recipe):
+    """Replace the FTS row of ``recipe``; call inside the write's transaction."""
+    session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {"id": recipe.id})
+    session.execute(
+        text(
+            f"INSERT INTO {FTS_TABLE} (rowid, navn, placering, ingredienser) "
+            "VALUES (:id, :navn, :placering, :ingredienser)"
+        ),
+        {
+            "id": recipe.id,
+            "navn": recipe.navn,
+            "placering": recipe.placering or "",
+            "ingredienser": "\n".join(recipe.ingredienser or {}),
+        },
+    )
+
+
+def search_recipe_fts(session, query, limit=RESULT_LIMIT, candidates=FTS_CANDIDATES):
+    """Return ``(names, total_matches)`` for a lower-cased query of 3+ characters.
+
+    Visible recipes containing ``query`` are ranked by bm25; the top
+    ``candidates`` are re-ranked by the fuzzy score, bm25 breaking ties.
+    """
+    params = {"query": '"' + query.replace('"', '""') + '"', "candidates": candidates}
+    matches = (
+        f"FROM {FTS_TABLE} JOIN recipe ON recipe.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH :query "
+        "AND (recipe.is_blacklisted = 0 OR recipe.is_whitelisted = 1)"
+    )
+    rows = session.execute(
+        text(
+            f"SELECT recipe.navn, {FTS_TABLE}.ingredienser {matches} "
+            f"ORDER BY bm25({FTS_TABLE}) LIMIT :candidates"
+        ),
+        params,
+    ).all()
+    total = session.execute(text(f"SELECT count(*) {matches}"), params).scalar()
+
+    def score(row):
+        navn, ingredients = row
+        return max(fuzz.partial_ratio(query, value.lower()) for value in [navn, *ingredients.split("\n")])
+
+    ranked = sorted(rows, key=lambda row: -score(row))
+    return [navn for navn, _ in ranked[:limit]], total
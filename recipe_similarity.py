@@ -0,0 +1,227 @@
+"""TF-IDF similarity between recipes' ingredient lists.
+
+Each recipe is a sparse, L2-normalised vector over its folded ingredient names
+and the words in them (so "Røde linser" and "Linser" still overlap). Vectors are
+stored as postings ``term -> [(position, weight)]``; the neighbours of one
+recipe are a single sparse dot product against those postings followed by a
+top-k heap selection.
+
+``MinHashIndex`` flags near-duplicates: each recipe's term set gets a MinHash
+signature, split into LSH bands. Recipes sharing a band bucket are candidates
+and are confirmed on their exact Jaccard similarity, so neither a lookup nor
+the full clustering compares all pairs. ``add``/``discard`` patch the buckets
+for a single recipe write, so writes do not rebuild the index.
+"""
+import hashlib
+import heapq
+import math
+import random
+import threading
+
+from recipe_search import fold_text
+
+SIMILAR_LIMIT = 10
+MINHASH_BANDS = 16
+MINHASH_ROWS = 3
+DUPLICATE_THRESHOLD = 0.6
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_random = random.Random(2024)
+_PERMUTATIONS = [
+    (_random.randrange(1, _MERSENNE_PRIME), _random.randrange(_MERSENNE_PRIME))
+    for _ in range(MINHASH_BANDS * MINHASH_ROWS)
+]
+
+
+def ingredient_terms(ingredients):
+    """Folded ingredient names plus their words, as a set of terms."""
+    terms = set()
+    for ingredient in ingredients:
+        folded = fold_text(ingredient)
+        if not folded:
+            continue
+        terms.add(folded)
+        terms.update(word for word in folded.split() if len(word) > 2)
+    return terms
+
+
+class TfidfIndex:
+    """Ingredient TF-IDF vectors over ``(navn, slug, ingredient names, visible)`` tuples."""
+
+    def __init__(self, recipes):
+        self.recipes = []
+        self._positions = {}
+        documents = []
+        for navn, slug, ingredients, visible in recipes:
+            position = len(self.recipes)
+            self.recipes.append({"name": navn, "slug": slug, "ingredients": list(ingredients), "visible": visible})
+            self._positions[navn] = self._positions[slug] = position
+            documents.append(ingredient_terms(ingredients))
+
+        frequencies = {}
+        for terms in documents:
+            for term in terms:
+                frequencies[term] = frequencies.get(term, 0) + 1
+        total = len(documents)
+        idf = {term: math.log((1 + total) / (1 + count)) + 1 for term, count in frequencies.items()}
+
+        self.vectors = []
+        self.postings = {}
+        for position, terms in enumerate(documents):
+            norm = math.sqrt(sum(idf[term] ** 2 for term in terms)) or 1.0
+            vector = {term: idf[term] / norm for term in terms}
+            self.vectors.append(vector)
+            for term, weight in vector.items():
+                self.postings.setdefault(term, []).append((position, weight))
+
+    def position(self, identifier):
+        return self._positions.get(identifier)
+
+    def similar(self, identifier, k=SIMILAR_LIMIT):
+        """Return the ``k`` visible recipes closest to ``identifier`` (not itself)."""
+        source = self._positions[identifier]
+        scores = {}
+        for term, weight in self.vectors[source].items():
+            for position, other in self.postings[term]:
+                scores[position] = scores.get(position, 0.0) + weight * other
+        scores.pop(source, None)
+
+        best = heapq.nlargest(
+            k,
+            ((score, position) for position, score in scores.items() if self.recipes[position]["visible"]),
+            key=lambda item: (item[0], -item[1]),
+        )
+        source_terms = {fold_text(name) for name in self.recipes[source]["ingredients"]}
+        return [
+            {
+                "name": self.recipes[position]["name"],
+                "slug": self.recipes[position]["slug"],
+                "score": round(score, 4),
+                "shared": [
+                    name for name in self.recipes[position]["ingredients"] if fold_text(name) in source_terms
+                ],
+            }
+            for score, position in best
+        ]
+
+
+def _term_hash(term):
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def minhash_signature(terms):
+    """One minimum per permutation ``(a * h + b) mod p`` over the term hashes."""
+    hashes = [_term_hash(term) for term in terms]
+    if not hashes:
+        return None
+    return tuple(
+        min((a * value + b) % _MERSENNE_PRIME for value in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def jaccard(left, right):
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+class MinHashIndex:
+    """LSH buckets over ``(navn, slug, ingredient names)`` triples."""
+
+    def __init__(self, recipes, threshold=DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        # discarded recipes leave ``None`` behind so positions stay stable
+        self.recipes = []
+        self.terms = []
+        self.buckets = {}
+        self._positions = {}
+        self._lock = threading.Lock()
+        for navn, slug, ingredients in recipes:
+            self.add(navn, slug, ingredients)
+
+    def add(self, navn, slug, ingredients):
+        terms = ingredient_terms(ingredients)
+        keys = self._band_keys(terms)
+        with self._lock:
+            position = len(self.recipes)
+            self.recipes.append({"name": navn, "slug": slug})
+            self.terms.append(terms)
+            self._positions[navn] = position
+            for key in keys:
+                self.buckets.setdefault(key, []).append(position)
+
+    def discard(self, navn):
+        with self._lock:
+            position = self._positions.pop(navn, None)
+            if position is None:
+                return
+            for key in self._band_keys(self.terms[position]):
+                members = self.buckets[key]
+                members.remove(position)
+                if not members:
+                    del self.buckets[key]
+            self.recipes[position] = None
+            self.terms[position] = set()
+
+    @staticmethod
+    def _band_keys(terms):
+        signature = minhash_signature(terms)
+        if signature is None:
+            return []
+        return [
+            (band, signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS])
+            for band in range(MINHASH_BANDS)
+        ]
+
+    def _candidates(self, terms):
+        candidates = set()
+        for key in self._band_keys(terms):
+            candidates.update(self.buckets.get(key, ()))
+        return candidates
+
+    def duplicates_of(self, ingredients, exclude=None):
+        """Likely duplicates of an ingredient list, most similar first."""
+        terms = ingredient_terms(ingredients)
+        matches = []
+        with self._lock:
+            for position in self._candidates(terms):
+                recipe = self.recipes[position]
+                if exclude is not None and exclude in (recipe["name"], recipe["slug"]):
+                    continue
+                similarity = jaccard(terms, self.terms[position])
+                if similarity >= self.threshold:
+                    matches.append({**recipe, "similarity": round(similarity, 4)})
+        matches.sort(key=lambda match: (-match["similarity"], match["name"]))
+        return matches
+
+    def clusters(self):
+        """Groups of recipes linked by confirmed bucket pairs (union-find)."""
+        with self._lock:
+            return self._clusters()
+
+    def _clusters(self):
+        parent = list(range(len(self.recipes)))
+
+        def find(position):
+            while parent[position] != position:
+                parent[position] = parent[parent[position]]
+                position = parent[position]
+            return position
+
+        checked = set()
+        for members in self.buckets.values():
+            for index, left in enumerate(members):
+                for right in members[index + 1:]:
+                    if (left, right) in checked:
+                        continue
+                    checked.add((left, right))
+                    if jaccard(self.terms[left], self.terms[right]) >= self.threshold:
+                        parent[find(right)] = find(left)
+
+        groups = {}
+        for position, recipe in enumerate(self.recipes):
+            if recipe is not None:
+                groups.setdefault(find(position), []).append(recipe)
+        clusters = [sorted(group, key=lambda recipe: recipe["name"]) for group in groups.values() if len(group) > 1]
+        return sorted(clusters, key=lambda group: group[0]["name"])
@@ -0,0 +1,116 @@
+"""Small thread-safe LRU and background job used for per-process result caches."""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used entry.
+
+    Keeps hit/miss/eviction counters so cache sizes can be tuned from
+    ``GET /api/cache/stats``.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class BackgroundResult:
+    """The value of ``compute(key)`` for the latest ``key``, built off the request thread.
+
+    ``key`` is typically a tuple of catalog versions: a new key starts a
+    fresh computation on a daemon thread and the old value is dropped, so a
+    write invalidates the result without anyone having to clear it.
+    """
+
+    def __init__(self, compute):
+        self._compute = compute
+        self._lock = threading.Lock()
+        self._key = None
+        self._value = None
+        self._error = None
+        self._running = None
+
+    def get(self, key, wait=False):
+        """Return ``(ready, value)``, starting the computation for ``key`` if needed.
+
+        With ``wait`` the call blocks until that computation finished. A
+        failed computation re-raises its exception once.
+        """
+        with self._lock:
+            if self._running is None and self._key == key:
+                if self._error is not None:
+                    error, self._error, self._key = self._error, None, None
+                    raise error
+                return True, self._value
+            if self._running is None or self._running[0] != key:
+                thread = threading.Thread(target=self._run, args=(key,), daemon=True)
+                self._running = (key, thread)
+                thread.start()
+            thread = self._running[1]
+        if not wait:
+            return False, None
+        thread.join()
+        with self._lock:
+            if self._running is not None or self._key != key:
+                # superseded by a newer key while waiting
+                return False, None
+        return self.get(key)
+
+    def _run(self, key):
+        value = error = None
+        try:
+            value = self._compute(key)
+        except Exception as exc:
+            error = exc
+        with self._lock:
+            # a newer key may have started meanwhile; only the latest run lands
+            if self._running is not None and self._running[0] == key:
+                self._running = None
+                self._key, self._value, self._error = key, value, error
@@ -0,0 +1,183 @@
+"""Optional NumPy engine for bulk shopping aggregation.
+
+The recipe catalog is compiled once into a dense matrix with one column per
+``(ingredient, unit)`` pair and two rows per recipe: its own ingredients per
+recipe multiplier, and the fixed contribution of its (flattened) extras. A
+menu is then a weight vector and its shopping totals are one matrix–vector
+product; many menus at once are one matrix–matrix product. Intended for bulk
+work such as replaying ``menus/`` history or scoring planner candidates —
+``menu_builder.build_menu`` stays the reference implementation.
+
+Requires ``numpy`` (``pip install recipes[matrix]``).
+"""
+from sqlmodel import select
+
+from menu_builder import (
+    _recipe_data,
+    add_ingredient,
+    load_config,
+    menu_entry,
+    recipe_multiplier,
+    shopping_line,
+)
+from src.models import Recipe, get_session
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+
+class ShoppingMatrix:
+    """Compiled recipe × (ingredient, unit) matrix for one config snapshot.
+
+    ``recipes`` maps identifiers (slug and/or navn) to recipe dicts as returned
+    by ``menu_builder.prefetch_recipes``; aliases of the same recipe share a row.
+    """
+
+    def __init__(self, recipes, config):
+        if np is None:
+            raise RuntimeError("The matrix engine requires numpy; install it with `pip install numpy`.")
+
+        self.config = config
+        self.recipes = []
+        self._rows = {}
+        rows_by_name = {}
+        for identifier, recipe in recipes.items():
+            if not recipe:
+                continue
+            row = rows_by_name.get(recipe["navn"])
+            if row is None:
+                row = rows_by_name[recipe["navn"]] = len(self.recipes)
+                self.recipes.append(recipe)
+            self._rows[identifier] = row
+        for navn, row in rows_by_name.items():
+            self._rows.setdefault(navn, row)
+
+        self._columns = {}
+        self.names = []
+        self.units = []
+        own_entries = []
+        fixed_entries = []
+        self._fixed_sources = []
+        self._fixed_cache = {}
+        for row, recipe in enumerate(self.recipes):
+            for ingrediens, amount in recipe["ingredienser"].items():
+                if amount["amount"] > 0:
+                    own_entries.append((row, self._column(ingrediens, amount["unit"]), amount["amount"]))
+            fixed = self._flatten_extras(row, ())
+            fixed_entries.extend((row, column, value) for column, value, _ in fixed)
+            self._fixed_sources.append(sorted({(column, source) for column, _, source in fixed}))
+
+        size = len(self.recipes)
+        self.matrix = np.zeros((2 * size, len(self._columns)))
+        for row, column, value in own_entries:
+            self.matrix[row, column] += value
+        for row, column, value in fixed_entries:
+            self.matrix[size + row, column] += value
+        self._own_columns = [np.flatnonzero(self.matrix[row]) for row in range(size)]
+
+        self.priorities = np.array(
+            [self._priority(name) for name in self.names], dtype=float
+        )
+        self._name_rank = np.argsort(np.argsort(np.array(self.names, dtype=object)))
+
+    @classmethod
+    def from_db(cls, config=None):
+        with get_session() as session:
+            rows = session.exec(select(Recipe)).all()
+        recipes = {}
+        for row in rows:
+            recipes[row.slug] = recipes[row.navn] = _recipe_data(row)
+        return cls(recipes, config if config is not None else load_config())
+
+    def _column(self, ingrediens, unit):
+        key = (ingrediens, unit)
+        column = self._columns.get(key)
+        if column is None:
+            column = self._columns[key] = len(self.names)
+            self.names.append(ingrediens)
+            self.units.append(unit)
+        return column
+
+    def _priority(self, ingrediens):
+        category = self.config["varer"].get(ingrediens, "unknown")
+        return self.config["kategorier"].get(category, np.nan)
+
+    def _flatten_extras(self, row, trail):
+        """Return ``(column, amount, source recipe)`` for every extra of ``row``."""
+        if row in self._fixed_cache:
+            return self._fixed_cache[row]
+        if row in trail:
+            raise ValueError(f"Recipe extras form a cycle through '{self.recipes[row]['navn']}'")
+
+        recipe = self.recipes[row]
+        entries = []
+        for ingrediens, amount in (recipe.get("extras") or {}).items():
+            sub_row = self._rows.get(ingrediens)
+            if sub_row is None:
+                if amount["amount"] > 0:
+                    entries.append((self._column(ingrediens, amount["unit"]), amount["amount"], recipe["navn"]))
+                continue
+            sub_recipe = self.recipes[sub_row]
+            multiplier = recipe_multiplier(sub_recipe, amount)
+            for sub_name, sub_amount in sub_recipe["ingredienser"].items():
+                value = sub_amount["amount"] * multiplier
+                if value > 0:
+                    entries.append((self._column(sub_name, sub_amount["unit"]), value, sub_recipe["navn"]))
+            entries.extend(self._flatten_extras(sub_row, trail + (row,)))
+
+        self._fixed_cache[row] = entries
+        return entries
+
+    def weights(self, menu):
+        """Return the weight vector for ``menu`` and its non-recipe entries."""
+        size = len(self.recipes)
+        weights = np.zeros(2 * size)
+        loose = []
+        for entries in menu.values():
+            for entry in entries:
+                identifier, amount = menu_entry(entry)
+                row = self._rows.get(identifier)
+                if row is None:
+                    if amount["amount"] > 0:
+                        loose.append((identifier, amount))
+                    continue
+                weights[row] += recipe_multiplier(self.recipes[row], amount)
+                weights[size + row] += 1
+        return weights, loose
+
+    def totals(self, weights):
+        """Shopping totals per column; ``weights`` may be one vector or a stack."""
+        return weights @ self.matrix
+
+    def shopping(self, menu):
+        """Aggregate ``menu`` into the same structure ``build_menu`` returns."""
+        weights, loose = self.weights(menu)
+        totals = self.totals(weights)
+
+        columns = np.flatnonzero(totals > 0)
+        if np.isnan(self.priorities[columns]).any():
+            raise KeyError("unknown")
+        columns = columns[np.lexsort((self._name_rank[columns], self.priorities[columns]))]
+
+        shopping = {}
+        for column in columns:
+            line = shopping_line(shopping, self.names[column], self.config)
+            line.add(self.units[column], float(totals[column]))
+
+        size = len(self.recipes)
+        for row in np.flatnonzero(weights[:size] > 0):
+            navn = self.recipes[row]["navn"]
+            for column in self._own_columns[row]:
+                self._attribute(shopping, column, navn)
+        for row in np.flatnonzero(weights[size:] > 0):
+            for column, source in self._fixed_sources[row]:
+                self._attribute(shopping, column, source)
+
+        for identifier, amount in loose:
+            add_ingredient(identifier, amount, shopping, self.config, identifier)
+        return shopping
+
+    def _attribute(self, shopping, column, recipe_name):
+        shopping_line(shopping, self.names[column], self.config).recipes[recipe_name] += 1
@@ -1,12 +1,13 @@
 from __future__ import annotations
 
+import datetime
 import os
 from contextlib import contextmanager
 from typing import Dict, Optional, Any
 
-from sqlalchemy import Column
-from sqlalchemy.dialects.sqlite import JSON
-from sqlmodel import Field, Session, SQLModel, create_engine
+from sqlalchemy import Column, Integer, String, cast, func
+from sqlalchemy.dialects.sqlite import JSON, insert
+from sqlmodel import Field, Session, SQLModel, create_engine, select
 
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///recipes.db")
@@ -42,6 +43,18 @@ class Recipe(RecipeBase, table=True):
     is_whitelisted: bool = Field(default=False, index=True)
 
 
+class RecipeIngredient(SQLModel, table=True):
+    """One ``ingredienser``/``extras`` entry of a recipe, mirrored from its JSON."""
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    recipe_id: int = Field(foreign_key="recipe.id", index=True)
+    field: str = Field(default="ingredienser")
+    name: str
+    norm_name: str = Field(index=True)
+    amount: Optional[float] = None
+    unit: Optional[str] = Field(default=None, index=True)
+
+
 class CategoryConfig(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str = Field(index=True, unique=True)
@@ -61,11 +74,71 @@ class StapleItem(SQLModel, table=True):
     unit: str = Field(default="stk")
 
 
+class RecipePopularity(SQLModel, table=True):
+    recipe_id: int = Field(primary_key=True, foreign_key="recipe.id")
+    times_cooked: int = Field(default=0)
+    last_cooked: Optional[datetime.date] = None
+    score: float = Field(default=0.0)
+
+
+class MenuSessionState(SQLModel, table=True):
+    """Plates of a ``/api/menu/sessions`` session, so every worker can rebuild it."""
+
+    session_id: str = Field(primary_key=True)
+    plates: Dict[str, float] = Field(default_factory=dict, sa_column=Column(JSON))
+    revision: int = Field(default=1)
+    updated_at: datetime.datetime = Field(default_factory=lambda: datetime.datetime.now(datetime.timezone.utc), index=True)
+
+
 class AppSetting(SQLModel, table=True):
     key: str = Field(primary_key=True)
     value: Optional[str] = None
 
 
+CONFIG_VERSION_KEY = "config_version"
+RECIPES_VERSION_KEY = "recipes_version"
+STAPLES_VERSION_KEY = "staples_version"
+POPULARITY_VERSION_KEY = "popularity_version"
+
+
+def get_version(session: Session, key: str) -> int:
+    """Return the change counter stored in ``AppSetting`` under ``key``."""
+    setting = session.get(AppSetting, key)
+    try:
+        return int(setting.value) if setting and setting.value else 0
+    except ValueError:
+        return 0
+
+
+def get_versions(session: Session, *keys: str) -> tuple[int, ...]:
+    """Read several change counters with one query, in the order given."""
+    settings = session.exec(select(AppSetting).where(AppSetting.key.in_(keys))).all()
+    values = {setting.key: setting.value for setting in settings}
+    versions = []
+    for key in keys:
+        try:
+            versions.append(int(values.get(key) or 0))
+        except ValueError:
+            versions.append(0)
+    return tuple(versions)
+
+
+def bump_version(session: Session, key: str) -> int:
+    """Increment the counter under ``key`` as part of the session's transaction.
+
+    The increment is a single ``INSERT ... ON CONFLICT DO UPDATE ... RETURNING``,
+    so concurrent workers never collapse two bumps into one version, and the
+    first bump of a missing key cannot race another insert; returns the new
+    version.
+    """
+    statement = insert(AppSetting).values(key=key, value="1")
+    statement = statement.on_conflict_do_update(
+        index_elements=[AppSetting.key],
+        set_={"value": cast(func.coalesce(cast(AppSetting.value, Integer), 0) + 1, String)},
+    ).returning(AppSetting.value)
+    return int(session.execute(statement).scalar())
+
+
 def init_db() -> None:
     SQLModel.metadata.create_all(engine)
 
@@ -81,8 +154,18 @@ __all__ = [
     "IngredientConfig",
     "StapleItem",
     "AppSetting",
+    "RecipePopularity",
+    "MenuSessionState",
+    "CONFIG_VERSION_KEY",
+    "RECIPES_VERSION_KEY",
+    "STAPLES_VERSION_KEY",
+    "POPULARITY_VERSION_KEY",
+    "bump_version",
+    "get_version",
+    "get_versions",
     "Recipe",
     "RecipeBase",
+    "RecipeIngredient",
     "engine",
     "init_db",
     "get_session",
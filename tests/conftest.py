@@ -23,8 +23,8 @@ def app_bundle(tmp_path, monkeypatch):
     models.engine = models.create_engine(db_url, **models._sqlite_kwargs(db_url))
     models.init_db()
 
-    if "app" in sys.modules:
-        del sys.modules["app"]
+    for module_name in ("app", "menu_builder", "parser"):
+        sys.modules.pop(module_name, None)
     app_module = importlib.import_module("app")
     return app_module, models
 
@@ -165,6 +165,159 @@ def test_ingredient_usage_and_rename_flow(client):
     assert not rename.get_json()["conflicts"]
 
 
+def test_ingredient_rename_dry_run_previews_without_writing(client):
+    created = client.post(
+        "/api/recipes",
+        json=recipe_payload(
+            navn="Rodfrugtmos",
+            ingredienser={
+                "Gulerod": {"amount": 2, "unit": "stk"},
+                "Gulerødder": {"amount": 3, "unit": "stk"},
+            },
+        ),
+    ).get_json()["recipe"]
+    client.post("/api/recipes", json=recipe_payload(navn="Kartoffelmos", ingredienser={"Kartoffel": {"amount": 1, "unit": "kg"}}))
+
+    preview = client.post(
+        "/api/ingredients/rename",
+        json={"from": "gulerod", "to": "Gulerødder", "dry_run": True},
+    )
+    assert preview.status_code == 200
+    body = preview.get_json()
+    assert body["dry_run"] is True
+    assert body["updated_count"] == 1
+    assert body["changes"] == [{
+        "slug": created["slug"],
+        "name": "Rodfrugtmos",
+        "field": "ingredienser",
+        "before": {"Gulerod": {"amount": 2, "unit": "stk"}, "Gulerødder": {"amount": 3, "unit": "stk"}},
+        "after": {"Gulerødder": {"amount": 5.0, "unit": "stk"}},
+    }]
+    unchanged = client.get("/api/ingredients/usage", query_string={"name": "Gulerod"}).get_json()["usages"]
+    assert len(unchanged) == 1
+
+    applied = client.post("/api/ingredients/rename", json={"from": "gulerod", "to": "Gulerødder"})
+    assert applied.get_json() == {"updated_count": 1, "conflicts": []}
+    assert client.get("/api/ingredients/usage", query_string={"name": "Gulerod"}).get_json()["usages"] == []
+    recipe = client.get(f"/api/recipes/{created['slug']}").get_json()["recipe"]
+    assert recipe["ingredienser"] == {"Gulerødder": {"amount": 5.0, "unit": "stk"}}
+
+
+def test_ingredient_rename_batch_resolves_chains(client, add_category, add_ingredient_mapping):
+    produce = add_category("Grønt")
+    add_ingredient_mapping("Hvidløgsfed", produce.id)
+    add_ingredient_mapping("Hvidløg", produce.id)
+    client.post("/api/staples", json={"name": "hvidløgsfed", "amount": 2, "unit": "stk"})
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(
+            navn="Aioli",
+            ingredienser={"Hvidløgsfed": {"amount": 2, "unit": "stk"}, "Hvidløg": {"amount": 1, "unit": "stk"}},
+        ),
+    )
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Hvidløgsbrød", ingredienser={"Fed hvidløg": {"amount": 3, "unit": "stk"}}),
+    )
+    plan = {"renames": [{"from": "Fed hvidløg", "to": "hvidløgsfed"}, {"from": "Hvidløgsfed", "to": "Hvidløg"}]}
+
+    preview = client.post("/api/ingredients/rename/batch", json={**plan, "dry_run": True}).get_json()
+    assert preview["dry_run"] is True
+    assert [entry["to"] for entry in preview["renames"]] == ["Hvidløg", "Hvidløg"]
+    assert len(client.get("/api/ingredients/usage", query_string={"name": "Hvidløgsfed"}).get_json()["usages"]) == 1
+
+    applied = client.post("/api/ingredients/rename/batch", json=plan)
+    assert applied.status_code == 200
+    body = applied.get_json()
+    assert body["renames"] == [
+        {"from": "Fed hvidløg", "to": "Hvidløg", "updated_count": 1, "config_updated": 0, "staples_updated": 0},
+        {"from": "Hvidløgsfed", "to": "Hvidløg", "updated_count": 1, "config_updated": 1, "staples_updated": 1},
+    ]
+    assert body["updated_count"] == 2 and body["conflicts"] == []
+
+    usages = client.get("/api/ingredients/usage", query_string={"name": "Hvidløg"}).get_json()["usages"]
+    assert sorted(usage["recipe_name"] for usage in usages) == ["Aioli", "Hvidløgsbrød"]
+    config = client.get("/api/config").get_json()
+    assert [item["name"] for item in config["items"] if "vidl" in item["name"]] == ["Hvidløg"]
+    assert [item["name"] for item in config["staples"] if "vidl" in item["name"]] == ["Hvidløg"]
+
+    looping = client.post(
+        "/api/ingredients/rename/batch",
+        json={"renames": [{"from": "Løg", "to": "Skalotteløg"}, {"from": "Skalotteløg", "to": "løg"}]},
+    )
+    assert looping.status_code == 400
+
+
+def test_ingredient_rename_batch_case_only_rekeys_recipes(client, add_category, add_ingredient_mapping):
+    add_ingredient_mapping("Hvidløg", add_category("Grønt").id)
+    created = client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Aioli", ingredienser={"Hvidløg": {"amount": 2, "unit": "fed"}}),
+    ).get_json()["recipe"]
+
+    response = client.post("/api/ingredients/rename/batch", json={"renames": [{"from": "Hvidløg", "to": "hvidløg"}]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["renames"] == [
+        {"from": "Hvidløg", "to": "hvidløg", "updated_count": 1, "config_updated": 1, "staples_updated": 0},
+    ]
+    assert body["updated_count"] == 1
+
+    recipe = client.get(f"/api/recipes/{created['slug']}").get_json()["recipe"]
+    assert recipe["ingredienser"] == {"hvidløg": {"amount": 2, "unit": "fed"}}
+    config = client.get("/api/config").get_json()
+    assert [item["name"] for item in config["items"]] == ["hvidløg"]
+
+    again = client.post("/api/ingredients/rename/batch", json={"renames": [{"from": "Hvidløg", "to": "hvidløg"}]})
+    assert again.get_json()["renames"][0]["updated_count"] == 0
+
+
+def test_ingredient_clusters_report(client):
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(
+            navn="Bruschetta",
+            ingredienser={"Tomater": {"amount": 4, "unit": "stk"}, "Persille": {"amount": 1, "unit": "bundt"}},
+        ),
+    )
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(
+            navn="Tomatsalat",
+            ingredienser={"Tomat": {"amount": 2, "unit": "stk"}, "Persille": {"amount": 1, "unit": "bundt"}},
+        ),
+    )
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(
+            navn="Tabbouleh",
+            ingredienser={"tomat": {"amount": 1, "unit": "stk"}, "persile": {"amount": 1, "unit": "bundt"}},
+        ),
+    )
+
+    ready = client.get("/api/ingredients/clusters", query_string={"wait": "true"})
+    assert ready.status_code == 200
+    clusters = ready.get_json()["clusters"]
+    assert [cluster["canonical"] for cluster in clusters] == ["Persille", "Tomat"]
+    assert [entry["name"] for entry in clusters[1]["names"]] == ["Tomat", "tomat", "Tomater"]
+
+    client.post("/api/recipes", json=recipe_payload(navn="Gazpacho", ingredienser={"Agurk": {"amount": 1, "unit": "stk"}}))
+    stale = client.get("/api/ingredients/clusters")
+    assert stale.status_code == 202
+    assert stale.get_json() == {"status": "computing"}
+    assert client.get("/api/ingredients/clusters", query_string={"wait": "1"}).status_code == 200
+
+
+def test_ingredient_rename_dry_run_skips_unchanged_recipes(client):
+    client.post("/api/recipes", json=recipe_payload(navn="Aioli", ingredienser={"hvidløg": {"amount": 2, "unit": "fed"}}))
+
+    preview = client.post(
+        "/api/ingredients/rename",
+        json={"from": "Hvidløg", "to": "hvidløg", "dry_run": True},
+    ).get_json()
+    assert preview == {"dry_run": True, "updated_count": 0, "changes": [], "conflicts": []}
+
+
 def test_ingredient_rename_conflict_detection(client):
     payload = recipe_payload(
         navn="Carrot Mash",
@@ -217,13 +370,7 @@ def test_menu_generation_includes_staples(client, app_module, add_category, monk
         return path
 
     monkeypatch.setattr(app_module, "save_menu", fake_save)
-
-    original_add = app_module.MenuText.add
-
-    def noop_add(self, s):
-        self.text += s + "\n"
-
-    monkeypatch.setattr(app_module.MenuText, "add", noop_add)
+    monkeypatch.chdir(tmp_path)
 
     response = client.post("/api/menu/generate", json={"menu_data": {recipe_name: 4}})
     assert response.status_code == 200
@@ -231,8 +378,42 @@ def test_menu_generation_includes_staples(client, app_module, add_category, monk
     assert "# Menu" in markdown
     assert recipe_name in markdown
     assert "Salt" in markdown
+    assert not (tmp_path / "shopping.md").exists()
+
+
+def test_menu_generation_only_writes_snapshot_on_export(client, app_module, add_category, monkeypatch, tmp_path):
+    add_category(name="unknown", priority=999)
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Plain Rice", ingredienser={"Ris": {"amount": 1, "unit": "kg"}}, extras={}),
+    )
 
-    monkeypatch.setattr(app_module.MenuText, "add", original_add)
+    saved = []
+
+    def fake_save(menu_dict):
+        saved.append(menu_dict)
+        return tmp_path / "menu.yml"
+
+    monkeypatch.setattr(app_module, "save_menu", fake_save)
+    monkeypatch.chdir(tmp_path)
+
+    response = client.post("/api/menu/generate", json={"menu_data": {"Plain Rice": 4}})
+    assert response.status_code == 200
+    assert saved == []
+
+    response = client.post("/api/menu/generate", json={"menu_data": {"Plain Rice": 4}, "export": True})
+    assert response.status_code == 200
+    assert "Plain Rice" in saved[0]
+    assert (tmp_path / "shopping.md").read_text(encoding="utf-8") == response.get_json()["markdown"]
+
+
+def test_menu_text_buffers_lines(app_module, tmp_path):
+    menu_text = app_module.MenuText()
+    menu_text.add("# Menu")
+    menu_text.add("## Pasta")
+
+    assert str(menu_text) == "# Menu\n## Pasta\n"
+    assert menu_text.write(tmp_path / "shopping.md").read_text(encoding="utf-8") == str(menu_text)
 
 
 def test_menu_generation_requires_known_recipes(client):
@@ -294,3 +475,681 @@ def test_create_recipe_from_image_uses_stub(client, app_module, monkeypatch, mak
     assert payload["navn"] == "Photo Recipe"
     assert payload["suggested_slug"].startswith(existing.slug)
     assert "raw_yaml" in payload
+    assert response.get_json()["duplicates"] == []
+
+
+def test_recipe_extras_cycles_are_rejected(client):
+    client.post("/api/recipes", json=recipe_payload(navn="Pizzadej", extras={}))
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Pizza", extras={"pizzadej": {"amount": 1, "unit": "recipe"}}),
+    )
+
+    self_loop = client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Ouroboros", extras={"Ouroboros": {"amount": 1, "unit": "recipe"}}),
+    )
+    assert self_loop.status_code == 400
+
+    cycle = client.patch("/api/recipes/pizzadej", json={"extras": {"Pizza": {"amount": 1, "unit": "recipe"}}})
+    assert cycle.status_code == 400
+    assert "cycle" in cycle.get_json()["error"]
+
+
+def test_recipe_bill_of_materials(client, app_module):
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Raita", antal=4, ingredienser={"Yoghurt": {"amount": 4, "unit": "dl"}}, extras={}),
+    )
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(
+            navn="Dal",
+            antal=4,
+            ingredienser={"Linser": {"amount": 250, "unit": "g"}},
+            extras={"raita": {"amount": 1, "unit": "recipe"}, "Naan": {"amount": 2, "unit": "stk"}},
+        ),
+    )
+
+    response = client.get("/api/recipes/dal/bom", query_string={"plates": 8})
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert payload["multiplier"] == 2
+    items = {item["name"]: item for item in payload["items"]}
+    assert items["Linser"]["amount"] == 500
+    assert items["Yoghurt"] == {"name": "Yoghurt", "unit": "dl", "amount": 4, "recipes": ["Raita"]}
+    assert items["Naan"]["recipes"] == ["Dal"]
+
+    assert client.get("/api/recipes/ghost/bom").status_code == 404
+    for plates in ("nan", "inf", "-1"):
+        assert client.get("/api/recipes/dal/bom", query_string={"plates": plates}).status_code == 400
+
+    # writes keep the graph they validated instead of forcing a rebuild on the next read
+    graph = app_module.get_recipe_graph()
+    client.patch("/api/recipes/dal", json={"antal": 2})
+    patched = app_module.get_recipe_graph()
+    assert patched is not graph
+    client.patch("/api/recipes/dal", json={"placering": "Bog 2"})
+    assert app_module.get_recipe_graph() is patched
+    assert client.get("/api/recipes/dal/bom", query_string={"plates": 4}).get_json()["multiplier"] == 2
+    assert app_module.get_recipe_graph() is patched
+
+
+def test_menu_generation_formats(client, add_category, monkeypatch, tmp_path):
+    add_category(name="unknown", priority=999)
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Tomato Soup", ingredienser={"Tomat": {"amount": 8, "unit": "stk"}}, extras={}),
+    )
+    monkeypatch.chdir(tmp_path)
+    body = {"menu_data": {"Tomato Soup": 2}}
+
+    default = client.post("/api/menu/generate", json=body).get_json()
+    assert "Tomat" in default["markdown"]
+    assert default["menu"][0]["recipes"][0]["multiplier"] == 0.5
+
+    structured = client.post("/api/menu/generate?format=json", json=body).get_json()
+    assert "markdown" not in structured
+    category = structured["shopping"][0]
+    assert category["category"] == "unknown"
+    tomat = next(item for item in category["items"] if item["name"] == "Tomat")
+    assert tomat == {"name": "Tomat", "amounts": {"stk": 4}, "recipes": ["Tomato Soup"]}
+
+    csv_response = client.post("/api/menu/generate", json=body, headers={"Accept": "text/csv"})
+    assert csv_response.mimetype == "text/csv"
+    assert "unknown,Tomat,4,stk,Tomato Soup" in csv_response.get_data(as_text=True)
+
+    text_response = client.post("/api/menu/generate", json={**body, "format": "text"})
+    assert "  Tomat: 4 stk" in text_response.get_data(as_text=True)
+
+    assert client.post("/api/menu/generate?format=pdf", json=body).status_code == 400
+
+
+def test_menu_generation_cache_hits_and_invalidation(client, add_category, monkeypatch, tmp_path):
+    add_category(name="unknown", priority=999)
+    created = client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Pea Soup", ingredienser={"Ærter": {"amount": 500, "unit": "g"}}, extras={}),
+    )
+    slug = created.get_json()["recipe"]["slug"]
+    monkeypatch.chdir(tmp_path)
+    body = {"menu_data": {"Pea Soup": 4}, "format": "json"}
+
+    first = client.post("/api/menu/generate", json=body).get_json()
+    second = client.post("/api/menu/generate", json=body).get_json()
+    assert first == second
+    stats = client.get("/api/cache/stats").get_json()["menu"]
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+    client.patch(f"/api/recipes/{slug}", json={"ingredienser": {"Ærter": {"amount": 750, "unit": "g"}}})
+    third = client.post("/api/menu/generate", json=body).get_json()
+    items = {item["name"]: item for category in third["shopping"] for item in category["items"]}
+    assert items["Ærter"]["amounts"] == {"g": 750}
+    assert client.get("/api/cache/stats").get_json()["menu"]["misses"] == 2
+
+
+def test_menu_batch_generation_with_combined_list(client, add_category, monkeypatch, tmp_path):
+    add_category(name="unknown", priority=999)
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Lentil Stew", antal=4, ingredienser={"Linser": {"amount": 200, "unit": "g"}}, extras={}),
+    )
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Fish Cakes", antal=4, ingredienser={"Fisk": {"amount": 400, "unit": "g"}}, extras={}),
+    )
+    monkeypatch.chdir(tmp_path)
+
+    response = client.post(
+        "/api/menu/generate/batch",
+        json={
+            "menus": [
+                {"name": "Uge 10", "menu_data": {"Lentil Stew": 4}},
+                {"name": "Uge 11", "menu_data": {"Lentil Stew": 8, "Fish Cakes": 4}},
+            ],
+            "combined": True,
+            "format": "json",
+        },
+    )
+    assert response.status_code == 200
+    payload = response.get_json()
+
+    def amounts(result):
+        return {item["name"]: item["amounts"] for category in result["shopping"] for item in category["items"]}
+
+    assert [week["name"] for week in payload["weeks"]] == ["Uge 10", "Uge 11"]
+    assert amounts(payload["weeks"][0])["Linser"] == {"g": 200}
+    assert amounts(payload["weeks"][1])["Linser"] == {"g": 400}
+    assert amounts(payload["combined"])["Linser"] == {"g": 600}
+    assert amounts(payload["combined"])["Fisk"] == {"g": 400}
+
+    invalid = client.post("/api/menu/generate/batch", json={"menus": [{"menu_data": {"Ghost": 2}}]})
+    assert invalid.status_code == 400
+
+
+def test_menu_session_applies_incremental_changes(client, add_category, monkeypatch, tmp_path):
+    add_category(name="unknown", priority=999)
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Lentil Stew", antal=4, ingredienser={"Linser": {"amount": 200, "unit": "g"}, "Løg": {"amount": 1, "unit": "stk"}}, extras={}),
+    )
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Fish Cakes", antal=4, ingredienser={"Fisk": {"amount": 400, "unit": "g"}, "Løg": {"amount": 2, "unit": "stk"}}, extras={}),
+    )
+    monkeypatch.chdir(tmp_path)
+
+    created = client.post("/api/menu/sessions", json={"menu_data": {"Lentil Stew": 4}})
+    assert created.status_code == 201
+    session_id = created.get_json()["session_id"]
+
+    added = client.patch(
+        f"/api/menu/sessions/{session_id}",
+        json={"changes": [{"op": "add", "recipe": "fish-cakes", "plates": 8}]},
+    ).get_json()
+    assert added["rebuilt"] is False
+    assert added["plates"] == {"Lentil Stew": 4, "Fish Cakes": 8}
+    changed = {line["name"]: line for line in added["changed"]}
+    assert set(changed) == {"Fisk", "Løg"}
+    assert changed["Løg"]["amounts"] == {"stk": 5}
+
+    removed = client.patch(
+        f"/api/menu/sessions/{session_id}", json={"op": "remove", "recipe": "Lentil Stew"}
+    ).get_json()
+    changed = {line["name"]: line for line in removed["changed"]}
+    assert changed["Linser"] == {"name": "Linser", "priority": 999, "removed": True}
+    assert changed["Løg"]["amounts"] == {"stk": 4}
+    assert changed["Løg"]["recipes"] == ["Fish Cakes"]
+
+    # a recipe write invalidates the session, which is recomputed on the next edit
+    client.patch("/api/recipes/fish-cakes", json={"antal": 8})
+    rebuilt = client.patch(
+        f"/api/menu/sessions/{session_id}", json={"op": "set_plates", "recipe": "Fish Cakes", "plates": 8}
+    ).get_json()
+    assert rebuilt["rebuilt"] is True
+    assert {line["name"]: line["amounts"] for line in rebuilt["changed"]}["Fisk"] == {"g": 400}
+
+    # an invalid change rejects the whole batch, earlier changes included
+    rejected = client.patch(
+        f"/api/menu/sessions/{session_id}",
+        json={"changes": [{"op": "add", "recipe": "Lentil Stew", "plates": 4}, {"op": "bogus"}]},
+    )
+    assert rejected.status_code == 400
+    assert client.get(f"/api/menu/sessions/{session_id}").get_json()["plates"] == {"Fish Cakes": 8}
+    not_finite = client.patch(
+        f"/api/menu/sessions/{session_id}", json={"op": "set_plates", "recipe": "Fish Cakes", "plates": "nan"}
+    )
+    assert not_finite.status_code == 400
+
+    assert client.delete(f"/api/menu/sessions/{session_id}").status_code == 200
+    assert client.get(f"/api/menu/sessions/{session_id}").status_code == 404
+
+
+def test_menu_session_survives_worker_without_cached_copy(client, app_module, models, add_category, monkeypatch, tmp_path):
+    add_category(name="unknown", priority=999)
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Lentil Stew", antal=4, ingredienser={"Linser": {"amount": 200, "unit": "g"}}, extras={}),
+    )
+    monkeypatch.chdir(tmp_path)
+    session_id = client.post("/api/menu/sessions", json={"menu_data": {"Lentil Stew": 4}}).get_json()["session_id"]
+
+    # another worker only has the stored plates
+    app_module._menu_sessions.clear()
+    patched = client.patch(f"/api/menu/sessions/{session_id}", json={"op": "set_plates", "recipe": "Lentil Stew", "plates": 8})
+    assert patched.status_code == 200
+    assert patched.get_json()["plates"] == {"Lentil Stew": 8}
+
+    # a save from another worker moves the stored revision; this worker rebuilds from it
+    with app_module.get_session() as session:
+        state = session.get(models.MenuSessionState, session_id)
+        state.plates = {"Lentil Stew": 2}
+        state.revision += 1
+        session.add(state)
+        session.commit()
+    current = client.get(f"/api/menu/sessions/{session_id}").get_json()
+    assert current["plates"] == {"Lentil Stew": 2}
+    amounts = {item["name"]: item["amounts"] for category in current["shopping"] for item in category["items"]}
+    assert amounts["Linser"] == {"g": 100}
+
+
+def test_menu_session_expands_recipe_staples_like_generate(client, app_module, add_category, monkeypatch, tmp_path):
+    add_category(name="unknown", priority=999)
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Pizzadej", antal=1, ingredienser={"Mel": {"amount": 500, "unit": "g"}}, extras={}),
+    )
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Lentil Stew", antal=4, ingredienser={"Linser": {"amount": 200, "unit": "g"}}, extras={}),
+    )
+    client.post("/api/staples", json={"name": "Pizzadej", "amount": 1, "unit": "stk"})
+    monkeypatch.chdir(tmp_path)
+
+    payload = client.post("/api/menu/sessions", json={"menu_data": {"Lentil Stew": 4}}).get_json()
+    expected = app_module.menu_builder.expand_menu(app_module.build_menu_structure({"Lentil Stew": 4})).to_dict()
+    assert payload["shopping"] == expected["shopping"]
+    assert payload["menu"] == expected["menu"]
+    staples_section = payload["menu"][-1]
+    assert [recipe["name"] for recipe in staples_section["recipes"]] == ["Pizzadej"]
+
+
+def test_recipe_search_index_matches_brute_force_scoring(client):
+    from fuzzywuzzy import fuzz
+
+    recipes = {
+        "Butter Chicken": {"Kylling": {"amount": 600, "unit": "g"}, "Smør": {"amount": 50, "unit": "g"}},
+        "Chicken Curry": {"Kylling": {"amount": 500, "unit": "g"}, "Karry": {"amount": 2, "unit": "tsk"}},
+        "Dal": {"Linser": {"amount": 250, "unit": "g"}, "Løg": {"amount": 1, "unit": "stk"}},
+        "Kyllingesuppe": {"Kylling": {"amount": 400, "unit": "g"}, "Gulerod": {"amount": 3, "unit": "stk"}},
+        "Lasagne": {"Hakket oksekød": {"amount": 500, "unit": "g"}, "Løg": {"amount": 2, "unit": "stk"}},
+    }
+    for navn, ingredienser in recipes.items():
+        client.post("/api/recipes", json=recipe_payload(navn=navn, ingredienser=ingredienser, extras={}))
+
+    for query in ["kyl", "chicken", "løg", "curry", "xyz"]:
+        scored = []
+        for navn in sorted(recipes):
+            score = max(fuzz.partial_ratio(query, text.lower()) for text in [navn, *recipes[navn]])
+            if score > 80:
+                scored.append((navn, score))
+        scored.sort(key=lambda item: -item[1])
+
+        payload = client.get("/api/recipes/search", query_string={"query": query}).get_json()
+        assert payload["recipes"] == [navn for navn, _ in scored[:6]]
+        assert payload["total_matches"] == len(scored)
+
+    # a recipe write invalidates the cached index
+    client.post("/api/recipes", json=recipe_payload(navn="Kyllingepie", extras={}))
+    payload = client.get("/api/recipes/search", query_string={"query": "kyllingepie"}).get_json()
+    assert "Kyllingepie" in payload["recipes"]
+
+
+def test_recipe_search_fts_engine_tracks_writes(client):
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Lasagne", ingredienser={"Hakket oksekød": {"amount": 500, "unit": "g"}}, extras={}),
+    )
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Dal", placering="Indisk bog", ingredienser={"Røde linser": {"amount": 250, "unit": "g"}}, extras={}),
+    )
+
+    def search(query):
+        return client.get("/api/recipes/search", query_string={"query": query, "engine": "fts"}).get_json()
+
+    assert search("lasag") == {"recipes": ["Lasagne"], "total_matches": 1}
+    assert search("indisk")["recipes"] == ["Dal"]
+    assert search("røde")["recipes"] == ["Dal"]
+
+    client.patch("/api/recipes/lasagne", json={"navn": "Lasagne al forno"})
+    assert search("forno")["recipes"] == ["Lasagne al forno"]
+
+    client.post("/api/ingredients/rename", json={"from": "Røde linser", "to": "Linser"})
+    assert search("røde")["total_matches"] == 0
+
+    # trigram tokens need three characters; shorter queries use the fuzzy engine
+    assert "total_matches" in search("da")
+    assert client.get("/api/recipes/search", query_string={"query": "dal", "engine": "nope"}).status_code == 400
+
+
+def test_recipe_typeahead_folds_diacritics_and_follows_writes(client, app_module):
+    for navn in ["Rødløg i ovn", "Butter Chicken", "Chicken Curry", "Dal"]:
+        client.post("/api/recipes", json=recipe_payload(navn=navn))
+
+    def typeahead(prefix):
+        return client.get("/api/recipes/typeahead", query_string={"prefix": prefix}).get_json()["recipes"]
+
+    assert typeahead("rod") == ["Rødløg i ovn"]
+    # whole-name prefixes rank before later-word matches
+    assert typeahead("chick") == ["Chicken Curry", "Butter Chicken"]
+    assert typeahead("") == []
+
+    index = app_module.get_typeahead_index()
+    client.patch("/api/recipes/dal", json={"navn": "Dal makhani"})
+    client.post("/api/recipes", json=recipe_payload(navn="Æblekage"))
+
+    # writes in this process update the index in place
+    assert app_module.get_typeahead_index() is index
+    assert typeahead("makh") == ["Dal makhani"]
+    assert typeahead("aeble") == ["Æblekage"]
+    assert typeahead("dal") == ["Dal makhani"]
+
+
+def test_recipes_by_ingredients_ranks_by_coverage(client):
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Dal", ingredienser={"Linser": {"amount": 250, "unit": "g"}, "Løg": {"amount": 1, "unit": "stk"}}),
+    )
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(
+            navn="Chili",
+            ingredienser={
+                "Kidneybønner": {"amount": 2, "unit": "dåse"},
+                "Løg": {"amount": 1, "unit": "stk"},
+                "Hakket oksekød": {"amount": 500, "unit": "g"},
+            },
+        ),
+    )
+    client.post("/api/recipes", json=recipe_payload(navn="Pasta", ingredienser={"Pasta": {"amount": 500, "unit": "g"}}))
+
+    response = client.post("/api/recipes/by-ingredients", json={"ingredients": ["løg", "Linser", "Kidneybønner", "Trøfler"]})
+    assert response.status_code == 200
+    payload = response.get_json()
+
+    assert [match["name"] for match in payload["recipes"]] == ["Dal", "Chili"]
+    assert payload["recipes"][0]["coverage"] == 1.0
+    assert payload["recipes"][0]["missing"] == []
+    assert payload["recipes"][1]["matched"] == ["Kidneybønner", "Løg"]
+    assert payload["recipes"][1]["missing"] == ["Hakket oksekød"]
+    assert payload["unknown"] == ["Trøfler"]
+
+    strict = client.post("/api/recipes/by-ingredients", json={"ingredients": ["Løg", "Linser"], "max_missing": 0}).get_json()
+    assert [match["name"] for match in strict["recipes"]] == ["Dal"]
+    assert client.post("/api/recipes/by-ingredients", json={"ingredients": "Løg"}).status_code == 400
+
+
+def test_similar_recipes_use_tfidf_and_skip_blacklisted(client):
+    def ingredients(*names):
+        return {name: {"amount": 1, "unit": "stk"} for name in names}
+
+    client.post("/api/recipes", json=recipe_payload(navn="Chili con carne", ingredienser=ingredients("Kidneybønner", "Hakket oksekød", "Løg", "Spidskommen")))
+    client.post("/api/recipes", json=recipe_payload(navn="Chili sin carne", ingredienser=ingredients("Kidneybønner", "Sorte bønner", "Løg", "Spidskommen")))
+    client.post("/api/recipes", json=recipe_payload(navn="Frikadeller", ingredienser=ingredients("Hakket svinekød", "Løg", "Æg")))
+    client.post("/api/recipes", json=recipe_payload(navn="Pasta", ingredienser=ingredients("Pasta", "Parmesan")))
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Old Chili", ingredienser=ingredients("Kidneybønner", "Hakket oksekød", "Løg", "Spidskommen"), is_blacklisted=True),
+    )
+
+    response = client.get("/api/recipes/chili-con-carne/similar", query_string={"k": 5})
+    assert response.status_code == 200
+    payload = response.get_json()
+
+    names = [match["name"] for match in payload["similar"]]
+    assert payload["recipe"] == "Chili con carne"
+    assert names == ["Chili sin carne", "Frikadeller"]
+    assert payload["similar"][0]["shared"] == ["Kidneybønner", "Løg", "Spidskommen"]
+    assert client.get("/api/recipes/ghost/similar").status_code == 404
+
+
+def test_recipe_duplicates_are_flagged_and_clustered(client, app_module):
+    def ingredients(*names):
+        return {name: {"amount": 1, "unit": "stk"} for name in names}
+
+    pita = ingredients("Pitabrød", "Kebab", "Salat", "Tomat", "Agurk", "Hvidløgsdressing")
+    first = client.post("/api/recipes", json=recipe_payload(navn="Pita med kebab", ingredienser=pita))
+    assert first.get_json()["duplicates"] == []
+
+    second = client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Pitadrøm", ingredienser={**pita, "Chilisauce": {"amount": 1, "unit": "fl"}}),
+    )
+    assert second.status_code == 201
+    assert [match["name"] for match in second.get_json()["duplicates"]] == ["Pita med kebab"]
+
+    client.post("/api/recipes", json=recipe_payload(navn="Risengrød", ingredienser=ingredients("Grødris", "Mælk", "Vand", "Salt")))
+    client.post("/api/recipes", json=recipe_payload(navn="Risengrød i ovn", ingredienser=ingredients("Grødris", "Mælk", "Salt")))
+    client.post("/api/recipes", json=recipe_payload(navn="Dal", ingredienser=ingredients("Linser", "Løg")))
+
+    clusters = client.get("/api/recipes/duplicates").get_json()["clusters"]
+    assert [[recipe["name"] for recipe in cluster] for cluster in clusters] == [
+        ["Pita med kebab", "Pitadrøm"],
+        ["Risengrød", "Risengrød i ovn"],
+    ]
+
+    # writes patch the cached index instead of rebuilding it
+    index = app_module.get_duplicate_index()
+    slug = second.get_json()["recipe"]["slug"]
+    client.patch(f"/api/recipes/{slug}", json={"ingredienser": ingredients("Kylling", "Ris", "Karry")})
+    client.post("/api/recipes", json=recipe_payload(navn="Dal med ris", ingredienser=ingredients("Linser", "Løg", "Ris")))
+    assert app_module.get_duplicate_index() is index
+    clusters = client.get("/api/recipes/duplicates").get_json()["clusters"]
+    assert [[recipe["name"] for recipe in cluster] for cluster in clusters] == [
+        ["Dal", "Dal med ris"],
+        ["Risengrød", "Risengrød i ovn"],
+    ]
+
+
+def test_recipe_search_results_are_cached_per_catalog_version(client):
+    client.post("/api/recipes", json=recipe_payload(navn="Kyllingesuppe"))
+
+    def search(query):
+        return client.get("/api/recipes/search", query_string={"query": query}).get_json()
+
+    def stats():
+        return client.get("/api/cache/stats").get_json()["search"]
+
+    assert search("kyl")["recipes"] == ["Kyllingesuppe"]
+    assert search("  KYL ")["recipes"] == ["Kyllingesuppe"]
+    assert (stats()["hits"], stats()["misses"]) == (1, 1)
+
+    # the write moves the catalog version, so the old entry is never served
+    client.post("/api/recipes", json=recipe_payload(navn="Kyllingepie"))
+    assert search("kyl")["recipes"] == ["Kyllingepie", "Kyllingesuppe"]
+    assert (stats()["hits"], stats()["misses"]) == (1, 2)
+
+
+def test_recipe_search_boosts_dishes_cooked_often(client, monkeypatch, tmp_path):
+    client.post("/api/recipes", json=recipe_payload(navn="Kyllingepie"))
+    client.post("/api/recipes", json=recipe_payload(navn="Kyllingesuppe"))
+
+    def search(query):
+        return client.get("/api/recipes/search", query_string={"query": query}).get_json()["recipes"]
+
+    assert search("kylling") == ["Kyllingepie", "Kyllingesuppe"]
+
+    history = tmp_path / "menus"
+    history.mkdir()
+    for week in (10, 11, 12):
+        menu = {"Suppe (mandag)": [{"kyllingesuppe": {"amount": 4, "unit": "plates"}}]}
+        (history / f"uge_{week}_2023.yaml").write_text(yaml.dump(menu, allow_unicode=True), encoding="utf-8")
+    (history / "uge_01_2021.yaml").write_text(
+        yaml.dump({"Pie": [{"Kyllingepie": {"amount": 0, "unit": "plates"}}]}), encoding="utf-8"
+    )
+    monkeypatch.setenv("MENU_HISTORY_DIR", str(history))
+
+    refreshed = client.post("/api/recipes/popularity/refresh")
+    assert refreshed.get_json() == {"menus": 4, "recipes": 1}
+    assert search("kylling") == ["Kyllingesuppe", "Kyllingepie"]
+    # popularity only reorders: matching and total_matches are unchanged
+    assert client.get("/api/recipes/search", query_string={"query": "kylling"}).get_json()["total_matches"] == 2
+
+
+def test_recipe_popularity_follows_exports_and_seeds_empty_tables(
+    client, app_module, models, add_category, monkeypatch, tmp_path
+):
+    add_category(name="unknown", priority=999)
+    client.post("/api/recipes", json=recipe_payload(navn="Kyllingepie"))
+    client.post("/api/recipes", json=recipe_payload(navn="Kyllingesuppe"))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("MENU_HISTORY_DIR", str(tmp_path / "menus"))
+
+    def search(query):
+        return client.get("/api/recipes/search", query_string={"query": query}).get_json()["recipes"]
+
+    assert search("kylling") == ["Kyllingepie", "Kyllingesuppe"]
+
+    response = client.post("/api/menu/generate", json={"menu_data": {"Kyllingesuppe": 4}, "export": True})
+    assert response.status_code == 200
+    assert len(list((tmp_path / "menus").glob("uge_*.yaml"))) == 1
+    assert search("kylling") == ["Kyllingesuppe", "Kyllingepie"]
+
+    with app_module.get_session() as session:
+        for row in session.exec(models.select(models.RecipePopularity)).all():
+            session.delete(row)
+        session.commit()
+
+    app_module.seed_recipe_popularity()
+    with app_module.get_session() as session:
+        assert len(session.exec(models.select(models.RecipePopularity)).all()) == 1
+        version = models.get_version(session, app_module.POPULARITY_VERSION_KEY)
+
+    # rows exist now, so a second startup leaves them alone
+    app_module.seed_recipe_popularity()
+    with app_module.get_session() as session:
+        assert models.get_version(session, app_module.POPULARITY_VERSION_KEY) == version
+
+
+def test_recipe_popularity_ignores_andet_and_staples(client, app_module, models, monkeypatch, tmp_path):
+    for navn in ("Kyllingesuppe", "Chili con carne", "Rugboller", "Risengrød"):
+        client.post("/api/recipes", json=recipe_payload(navn=navn))
+    client.post("/api/staples", json={"name": "Risengrød", "amount": 1})
+    history = tmp_path / "menus"
+    history.mkdir()
+    monkeypatch.setenv("MENU_HISTORY_DIR", str(history))
+
+    def dinners(week):
+        menu = {"Suppe (mandag)": [{"Kyllingesuppe": {"amount": 4, "unit": "plates"}}]}
+        if week == 10:
+            menu["Chili (tirsdag)"] = [{"Chili con carne": {"amount": 4, "unit": "plates"}}]
+        return menu
+
+    def write(extras):
+        for week in (10, 11, 12):
+            menu = {**dinners(week), **extras}
+            (history / f"uge_{week}_2023.yaml").write_text(yaml.dump(menu, allow_unicode=True), encoding="utf-8")
+
+    def scores():
+        client.post("/api/recipes/popularity/refresh")
+        with app_module.get_session() as session:
+            rows = session.exec(
+                models.select(models.Recipe.navn, models.RecipePopularity.score).join(
+                    models.RecipePopularity, models.RecipePopularity.recipe_id == models.Recipe.id
+                )
+            ).all()
+        return dict(rows)
+
+    write({})
+    baseline = scores()
+    assert baseline["Kyllingesuppe"] == 1.0
+
+    # the same rugboller every week, in the silent section and the staples section
+    write(
+        {
+            "Andet": [{"Rugboller": {"amount": 1, "unit": "pose"}}],
+            "Weekly staples": [{"Rugboller": {"amount": 1, "unit": "pose"}}],
+            "Morgenmad": [{"Risengrød": {"amount": 1, "unit": "stk"}}],
+        }
+    )
+    assert scores() == baseline
+
+
+def test_similar_ingredients_index_follows_writes(client, app_module, add_category):
+    produce = add_category(name="Produce", priority=1)
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Suppe", ingredienser={"Gulerødder": {"amount": 3, "unit": "stk"}}, extras={}),
+    )
+
+    def similar(name):
+        return client.get("/api/ingredients/similar", query_string={"name": name}).get_json()["names"]
+
+    assert similar("gulerod") == ["Gulerødder"]
+    index = app_module.get_ingredient_name_index()
+
+    client.post("/api/config/items", json={"name": "Gulerod", "category_id": produce.id})
+    client.post("/api/recipes", json=recipe_payload(navn="Salat", ingredienser={"Guleroden": {"amount": 1, "unit": "stk"}}, extras={}))
+    assert similar("gulerod") == ["Guleroden", "Gulerødder"]
+    assert similar("Gulerødder") == ["Guleroden", "Gulerod"]
+
+    client.post("/api/ingredients/rename", json={"from": "Gulerødder", "to": "Pastinak"})
+    assert similar("gulerod") == ["Guleroden"]
+    # every write above patched the same index instead of rebuilding it
+    assert app_module.get_ingredient_name_index() is index
+
+
+def test_recipe_ingredient_rows_mirror_recipe_json(client, app_module, models):
+    from sqlalchemy import event
+
+    created = client.post(
+        "/api/recipes",
+        json=recipe_payload(
+            navn="Rødkål",
+            ingredienser={"Rødkål": {"amount": 1, "unit": "stk"}, "Eddike": {"amount": 1, "unit": "dl"}},
+            extras={"Ribsgelé": {"amount": 1, "unit": "glas"}},
+        ),
+    )
+    slug = created.get_json()["recipe"]["slug"]
+    client.patch(f"/api/recipes/{slug}", json={"ingredienser": {"Rødkål": {"amount": 2, "unit": "stk"}}})
+
+    def rows():
+        with app_module.get_session() as session:
+            return sorted(
+                (row.field, row.name, row.norm_name, row.amount, row.unit)
+                for row in session.exec(app_module.select(models.RecipeIngredient)).all()
+            )
+
+    assert rows() == [
+        ("extras", "Ribsgelé", "ribsgele", 1.0, "glas"),
+        ("ingredienser", "Rødkål", "rodkal", 2.0, "stk"),
+    ]
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(models.engine, "before_cursor_execute", record)
+    try:
+        usage = client.get("/api/ingredients/usage", query_string={"name": "RODKAL"}).get_json()["usages"]
+    finally:
+        event.remove(models.engine, "before_cursor_execute", record)
+    assert usage == [{"recipe_slug": slug, "recipe_name": "Rødkål", "field": "ingredienser"}]
+    # answered from the indexed table, without loading recipe JSON columns
+    assert not any("recipe.ingredienser" in statement for statement in statements)
+
+    client.post("/api/ingredients/rename", json={"from": "ribsgele", "to": "Tyttebær"})
+    assert ("extras", "Tyttebær", "tyttebaer", 1.0, "glas") in rows()
+
+    app_module._known_unit_cache = None
+    assert "glas" in app_module.get_known_units()
+
+
+def test_ingredient_usage_batch_answers_many_names_in_one_query(client, models):
+    from sqlalchemy import event
+
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Dal", ingredienser={"Løg": {"amount": 1, "unit": "stk"}, "Linser": {"amount": 250, "unit": "g"}}, extras={}),
+    )
+    client.post(
+        "/api/recipes",
+        json=recipe_payload(navn="Chili", ingredienser={"Løg": {"amount": 2, "unit": "stk"}}, extras={"Linser": {"amount": 1, "unit": "dl"}}),
+    )
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "recipeingredient" in statement:
+            statements.append(statement)
+
+    event.listen(models.engine, "before_cursor_execute", record)
+    try:
+        response = client.post(
+            "/api/ingredients/usage/batch",
+            json={"names": ["løg", "LINSER", "Trøfler"], "include_extras": False},
+        )
+    finally:
+        event.remove(models.engine, "before_cursor_execute", record)
+
+    assert response.status_code == 200
+    usages = response.get_json()["usages"]
+    assert [usage["recipe_name"] for usage in usages["løg"]] == ["Dal", "Chili"]
+    assert [usage["recipe_name"] for usage in usages["LINSER"]] == ["Dal"]
+    assert usages["Trøfler"] == []
+    assert len(statements) == 1
+
+    assert client.post("/api/ingredients/usage/batch", json={"names": "Løg"}).status_code == 400
+
+
+def test_bump_version_upserts_missing_keys(app_module, models):
+    with app_module.get_session() as session:
+        assert models.bump_version(session, "test_version") == 1
+        assert models.bump_version(session, "test_version") == 2
+        session.commit()
+    with app_module.get_session() as session:
+        assert models.bump_version(session, "test_version") == 3
+        session.commit()
+        assert models.get_version(session, "test_version") == 3
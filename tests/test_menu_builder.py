@@ -0,0 +1,109 @@
+import pytest
+from sqlalchemy import event
+
+
+def test_build_menu_prefetches_recipes_in_bulk(app_module, models, make_recipe, add_category, monkeypatch, tmp_path):
+    import menu_builder
+
+    add_category(name="unknown", priority=999)
+    make_recipe(navn="Naan", antal=4, ingredienser={"Mel": {"amount": 400, "unit": "g"}})
+    make_recipe(
+        navn="Butter Chicken",
+        antal=4,
+        ingredienser={"Kylling": {"amount": 600, "unit": "g"}},
+        extras={"Naan": {"amount": 1, "unit": "recipe"}, "Koriander": {"amount": 1, "unit": "bdt"}},
+    )
+    make_recipe(
+        navn="Dal",
+        antal=4,
+        ingredienser={"Linser": {"amount": 250, "unit": "g"}},
+        extras={"Naan": {"amount": 1, "unit": "recipe"}},
+    )
+    monkeypatch.chdir(tmp_path)
+
+    recipe_queries = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if "FROM recipe" in statement:
+            recipe_queries.append(statement)
+
+    event.listen(models.engine, "before_cursor_execute", count)
+    try:
+        shopping = menu_builder.build_menu(
+            {
+                "Butter Chicken": [{"butter-chicken": {"amount": 8, "unit": "plates"}}],
+                "Dal": [{"dal": {"amount": 4, "unit": "plates"}}],
+                "Andet": [{"Salt": {"amount": 1, "unit": "stk"}}],
+            },
+            printer=lambda line: None,
+        )
+    finally:
+        event.remove(models.engine, "before_cursor_execute", count)
+
+    # one query for the menu entries, one for the extras they reference
+    assert len(recipe_queries) == 2
+    assert shopping[999, "Kylling"].amounts == {"g": 1200}
+    # the shared sub-recipe is added twice without being scaled twice
+    assert shopping[999, "Mel"].amounts == {"g": 800}
+    assert shopping[999, "Mel"].recipes == {"Naan": 2}
+    assert shopping[999, "Salt"].to_dict() == {
+        "name": "Salt",
+        "category": "unknown",
+        "priority": 999,
+        "amounts": {"stk": 1},
+        "recipes": ["Salt"],
+    }
+
+
+def test_config_snapshot_is_reused_until_config_changes(client, app_module):
+    import menu_builder
+
+    created = client.post("/api/config/categories", json={"name": "unknown", "priority": 5})
+    category_id = created.get_json()["categories"][0]["id"]
+
+    first = menu_builder.load_config()
+    assert menu_builder.load_config() is first
+    assert first["kategorier"]["unknown"] == 5
+
+    client.patch(f"/api/config/categories/{category_id}", json={"priority": 7})
+
+    second = menu_builder.load_config()
+    assert second is not first
+    assert second["kategorier"]["unknown"] == 7
+
+
+def test_shopping_matrix_matches_build_menu(app_module, make_recipe, add_category, add_ingredient_mapping, monkeypatch, tmp_path):
+    np = pytest.importorskip("numpy")
+    import menu_builder
+    from shopping_matrix import ShoppingMatrix
+
+    add_category(name="unknown", priority=999)
+    produce = add_category(name="Produce", priority=1)
+    add_ingredient_mapping("Koriander", produce.id)
+    make_recipe(navn="Naan", antal=4, ingredienser={"Mel": {"amount": 400, "unit": "g"}})
+    make_recipe(
+        navn="Butter Chicken",
+        antal=4,
+        ingredienser={"Kylling": {"amount": 600, "unit": "g"}, "Koriander": {"amount": 1, "unit": "bdt"}},
+        extras={"Naan": {"amount": 1, "unit": "recipe"}, "Koriander": {"amount": 1, "unit": "bdt"}},
+    )
+    make_recipe(navn="Dal", antal=2, ingredienser={"Linser": {"amount": 250, "unit": "g"}})
+    monkeypatch.chdir(tmp_path)
+
+    menu = {
+        "Butter Chicken": [{"butter-chicken": {"amount": 6, "unit": "plates"}}],
+        "Dal": [{"Dal": {"amount": 3, "unit": "plates"}}],
+        "Andet": [{"Salt": {"amount": 1, "unit": "stk"}}],
+    }
+    expected = menu_builder.build_menu(menu, printer=lambda line: None)
+
+    engine = ShoppingMatrix.from_db()
+    actual = engine.shopping(menu)
+
+    assert sorted(actual) == sorted(expected)
+    for key, line in expected.items():
+        assert actual[key].amounts == pytest.approx(line.amounts)
+        assert set(actual[key].recipes) == set(line.recipes)
+
+    weights = np.stack([engine.weights(menu)[0], engine.weights({"Dal": ["dal"]})[0]])
+    assert engine.totals(weights).shape == (2, len(engine.names))